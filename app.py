@@ -1,8 +1,6 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-import schedule
-import time
 import json
 import os
 from datetime import datetime
@@ -12,9 +10,13 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
-import pandas as pd
-from fetch_candles import fetch_all_candles
-from calculate_cointegration import calculate_cointegrated_pairs
+from job_runner import JobRunner, FileLock
+from candle_scheduler import CandleScheduler, FULL, INCREMENTAL
+from profiling import PROFILE_DIR, list_profiles, profiled, profiled_run
+from results_store import recent_runs, pair_history, pair_persistence
+
+# The fetch and analysis stacks (pandas, numpy, statsmodels, tqdm, websocket) are imported
+# inside the jobs that use them, so the web process boots without loading them.
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -63,16 +65,35 @@ def send_email_with_files(subject, body, files_to_attach=None):
         logger.error(f"❌ Failed to send email: {e}")
         return False
 
+@profiled("send_results_email")
 def send_results_email():
-    files_to_send = []
-    if os.path.exists('1_price_list.json'):
-        files_to_send.append('1_price_list.json')
-    if os.path.exists('2_cointegrated_pairs.csv'):
-        files_to_send.append('2_cointegrated_pairs.csv')
+    from result_package import (RESULTS_FILE, LINK_ONLY_FILES, PUBLIC_BASE_URL, build_summary, build_delta,
+                                save_delivery_state, split_by_size)
+
+    # Mail a compressed summary (and delta since the last send); raw dumps are linked, not attached
+    packaged, lines, state = [], [], None
+    if os.path.exists(RESULTS_FILE):
+        runs = recent_runs(1)
+        summary_file, summary = build_summary(run_info=runs[0] if runs else None)
+        delta_file, counts, state = build_delta()
+        packaged.append(summary_file)
+        metrics = summary["metrics"]
+        lines.append(f"Pairs found: {metrics['pairs']} across {metrics['symbols']} symbols "
+                     f"({metrics['pairs_p_below_0_01']} with p < 0.01)")
+        if delta_file:
+            packaged.append(delta_file)
+            lines.append(f"Since last send: {counts['added']} added, {counts['changed']} changed, "
+                         f"{counts['removed']} removed")
+        lines.append("")
+        lines.append("Top pairs:")
+        lines.extend(f"- {pair['sym_1']}/{pair['sym_2']}: p={pair['p_value']:.4g}, hedge={pair['hedge_ratio']:.4g}"
+                     for pair in summary["top_pairs"][:10])
 
-    if not files_to_send:
+    files_to_send, links = split_by_size(packaged + [RESULTS_FILE, *LINK_ONLY_FILES])
+    if not files_to_send and not links:
         logger.warning("⚠️ No result files found to send")
         return False
+    link_note = "" if PUBLIC_BASE_URL else " (PUBLIC_BASE_URL is not configured: open these paths on the bot's web server)"
 
     subject = f"Crypto Bot Results - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
     body = f"""
@@ -80,20 +101,36 @@ def send_results_email():
 
     Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
+    {chr(10).join(lines)}
+
     Files attached:
-    {chr(10).join(f'- {file}' for file in files_to_send)}
+    {chr(10).join(f'- {os.path.basename(file)}' for file in files_to_send)}
 
-    Total files: {len(files_to_send)}
+    Download links{link_note}:
+    {chr(10).join(f'- {link}' for link in links)}
 
     ---
     Automated Crypto Trading Bot
     """
-    return send_email_with_files(subject, body, files_to_send)
+    success = send_email_with_files(subject, body, files_to_send)
+    if success and state is not None:
+        save_delivery_state(state)
+    return success
 
-def fetch_candles_job():
+def post_scan_stages():
+    """Stages that run after every successful scan; the bootstrap is opt-in (PIPELINE_BOOTSTRAP=1)"""
+    from spread_matrix import build_spread_matrices
+    if os.environ.get('PIPELINE_BOOTSTRAP') == '1':
+        from bootstrap_significance import bootstrap_significance
+        bootstrap_significance()
+    build_spread_matrices()
+
+@profiled_run('fetch')
+def fetch_candles_job(progress=None):
     logger.info("🚀 Starting candle data fetch job...")
     try:
-        success = fetch_all_candles()
+        from fetch_candles import fetch_all_candles
+        success = fetch_all_candles(progress=progress)
         if success:
             logger.info("✅ Candle data fetch completed successfully")
             send_results_email()
@@ -104,11 +141,14 @@ def fetch_candles_job():
         logger.error(f"❌ Error in fetch_candles_job: {e}")
         return False
 
-def calculate_cointegration_job():
+@profiled_run('scan')
+def calculate_cointegration_job(progress=None):
     logger.info("🔄 Starting cointegration calculation job...")
     try:
-        success = calculate_cointegrated_pairs()
+        from calculate_cointegration import calculate_cointegrated_pairs
+        success = calculate_cointegrated_pairs(progress=progress)
         if success:
+            post_scan_stages()
             logger.info("✅ Cointegration calculation completed successfully")
             send_results_email()
         else:
@@ -118,11 +158,42 @@ def calculate_cointegration_job():
         logger.error(f"❌ Error in calculate_cointegration_job: {e}")
         return False
 
-def full_pipeline_job():
+@profiled_run('refresh')
+def refresh_job(progress=None):
+    """Cheap hourly refresh: the latest bars appended to the price store, then incremental statistics
+    and spreads/z-scores for the pairs already flagged"""
+    logger.info("🔁 Starting refresh job...")
+    try:
+        from fetch_candles import refresh_candles
+        from incremental_coint import update_incremental
+        from spread_matrix import build_spread_matrices
+        if not refresh_candles(progress=progress):
+            logger.error("❌ Refresh failed at candle fetching stage")
+            return False
+        if os.path.exists('2_cointegrated_pairs.csv'):
+            update_incremental()
+            build_spread_matrices()
+        logger.info("✅ Refresh completed successfully")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Error in refresh_job: {e}")
+        return False
+
+@profiled_run('pipeline')
+def full_pipeline_job(progress=None):
     logger.info("🎯 Starting full pipeline job...")
     try:
-        if fetch_all_candles():
-            calculate_cointegrated_pairs()
+        from fetch_candles import fetch_all_candles
+        from calculate_cointegration import calculate_cointegrated_pairs, scan_resumable
+        # A fresh fetch would invalidate an interrupted scan's checkpoint, so finish that scan first
+        if scan_resumable():
+            logger.info("♻️ Resuming the interrupted scan on the current price store, skipping the fetch")
+            fetched = True
+        else:
+            fetched = fetch_all_candles(progress=progress)
+        if fetched:
+            if calculate_cointegrated_pairs(progress=progress):
+                post_scan_stages()
             logger.info("✅ Full pipeline completed successfully")
             send_results_email()
             return True
@@ -133,17 +204,34 @@ def full_pipeline_job():
         logger.error(f"❌ Error in full_pipeline_job: {e}")
         return False
 
+# Background jobs for the web process
+JOB_FUNCTIONS = {
+    'fetch': fetch_candles_job,
+    'scan': calculate_cointegration_job,
+    'pipeline': full_pipeline_job,
+    'refresh': refresh_job,
+}
+# All jobs share one lock file: they read and write the same data files, so two never run at once,
+# also across the web and worker processes when they share this working directory
+JOB_LOCK_FILE = 'pipeline.lock'
+job_runner = JobRunner(max_workers=int(os.environ.get('JOB_WORKERS', 1)), lock=FileLock(JOB_LOCK_FILE))
+
+# Scheduled runs go through job_runner too, so they merge with or wait behind web-triggered jobs
+SCHEDULED_JOBS = {INCREMENTAL: 'refresh', FULL: 'pipeline'}
+
+def run_scheduled_job(kind):
+    job_kind = SCHEDULED_JOBS[kind]
+    job, _ = job_runner.submit(job_kind, JOB_FUNCTIONS[job_kind])
+    job = job_runner.wait(job["id"])
+    return job is not None and job["status"] == "done"
+
 def run_scheduler():
     logger.info("⏰ Starting scheduler...")
-    schedule.every(12).hours.do(full_pipeline_job)
-    logger.info("📅 Scheduler started. Jobs will run every 6 hours.")
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    CandleScheduler(run_scheduled_job).run_forever()
 
 # Web server with Flask
 try:
-    from flask import Flask, jsonify, send_from_directory
+    from flask import Flask, jsonify, send_from_directory, url_for, request
 
     app = Flask(__name__)
 
@@ -171,6 +259,69 @@ try:
                 "message": f"File not found: {filename}"
             }), 404
 
+    @app.route('/jobs/<kind>', methods=['POST'])
+    def submit_job(kind):
+        if kind not in JOB_FUNCTIONS:
+            return jsonify({
+                "status": "error",
+                "message": f"Unknown job type: {kind} (use {', '.join(JOB_FUNCTIONS)})"
+            }), 404
+        job, merged = job_runner.submit(kind, JOB_FUNCTIONS[kind])
+        job["merged"] = merged
+        job["url"] = url_for('job_status', job_id=job["id"])
+        return jsonify(job), 200 if merged else 202
+
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        job = job_runner.get(job_id)
+        if job is None:
+            return jsonify({
+                "status": "error",
+                "message": f"Job not found: {job_id}"
+            }), 404
+        return jsonify(job)
+
+    @app.route('/history/runs')
+    def history_runs():
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify(recent_runs(limit))
+
+    @app.route('/history/pair/<sym_1>/<sym_2>')
+    def history_pair(sym_1, sym_2):
+        return jsonify({
+            "persistence": pair_persistence(sym_1, sym_2),
+            "history": pair_history(sym_1, sym_2)
+        })
+
+    @app.route('/profiles')
+    def profiles():
+        return jsonify({
+            run: [url_for('download_file', filename=f"{PROFILE_DIR}/{run}/{name}") for name in files]
+            for run, files in list_profiles().items()
+        })
+
+    @app.route('/spreads/<sym_1>/<sym_2>')
+    def pair_spread(sym_1, sym_2):
+        from spread_matrix import open_spread_matrices, pair_column
+        try:
+            spreads, zscores, index = open_spread_matrices()
+        except FileNotFoundError:
+            return jsonify({"status": "error", "message": "Spread matrices not built yet"}), 404
+        column = pair_column(index, sym_1, sym_2)
+        if column is None:
+            return jsonify({"status": "error", "message": f"Pair not flagged: {sym_1}/{sym_2}"}), 404
+
+        # Only the requested tail of one column is read from the memory-mapped files
+        tail = min(request.args.get('tail', 500, type=int), index["bars"])
+        start_bar = index["bars"] - tail
+        pair = index["pairs"][column]
+        return jsonify({
+            **pair,
+            "start_at": [index["grid_start"] + bar * index["bar_seconds"] for bar in range(start_bar, index["bars"])],
+            "spread": [None if value != value else value for value in spreads[start_bar:, column].tolist()],
+            "zscore": [None if value != value else value for value in zscores[start_bar:, column].tolist()]
+        })
+
     def start_web_server():
         port = int(os.environ.get('PORT', 5000))
         app.run(host='0.0.0.0', port=port)
@@ -182,7 +333,6 @@ except ImportError:
 if __name__ == "__main__":
     if os.environ.get('PROCESS_TYPE') == 'worker':
         logger.info("👷 Starting as worker process with scheduler...")
-        full_pipeline_job()
         run_scheduler()
     else:
         logger.info("🌐 Starting as web process...")
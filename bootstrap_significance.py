@@ -0,0 +1,128 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from calculate_cointegration import RESULTS_FILE, batch_engle_granger, load_clean_series, pair_window
+
+# Block bootstrap of the flagged pairs: day-long blocks of hourly bars keep the residuals'
+# short-range dependence; resamples are evaluated BOOTSTRAP_BATCH at a time
+BOOTSTRAP_RESAMPLES = int(os.environ.get("BOOTSTRAP_RESAMPLES", 500))
+BOOTSTRAP_BLOCK_BARS = 24
+BOOTSTRAP_BATCH = 100
+BOOTSTRAP_SEED = 0
+HEDGE_CI_LEVEL = 0.95
+
+# Columns added to the results CSV
+BOOTSTRAP_COLUMNS = ["boot_t_value", "boot_p_value", "hedge_ci_low", "hedge_ci_high"]
+
+
+def block_indices(rng, n, block, k):
+    """(k, n) row indices for k moving-block resamples of a length-n series"""
+    n_blocks = -(-n // block)
+    starts = rng.integers(0, n - block + 1, size=(k, n_blocks))
+    return (starts[:, :, None] + np.arange(block)).reshape(k, -1)[:, :n]
+
+
+def bootstrap_pair(y, x, resamples=BOOTSTRAP_RESAMPLES, block=BOOTSTRAP_BLOCK_BARS, seed=BOOTSTRAP_SEED):
+    """Empirical significance of one pair's Engle-Granger statistic; returns BOOTSTRAP_COLUMNS values
+
+    The statistic is batch_engle_granger()'s one-lag t. Its null distribution comes from
+    residuals rebuilt as random walks out of block-resampled residual differences (no
+    cointegration, same x path); the hedge-ratio interval from block-resampled residual levels
+    around the fitted relation. Every resample of a batch is tested in one vectorized call.
+    """
+    X = x[:, None]
+    t_obs, hedge = batch_engle_granger(y, X)
+    t_obs, hedge = t_obs[0], hedge[0]
+    fitted = y.mean() + hedge * (x - x.mean())
+    resid = y - fitted
+    diffs = np.diff(resid)
+    diffs -= diffs.mean()
+    block = max(1, min(block, len(diffs)))
+
+    rng = np.random.default_rng(seed)
+    null_t, hedges = [], []
+    for done in range(0, resamples, BOOTSTRAP_BATCH):
+        k = min(BOOTSTRAP_BATCH, resamples - done)
+
+        steps = diffs[block_indices(rng, len(diffs), block, k)]
+        walks = resid[0] + np.concatenate([np.zeros((k, 1)), np.cumsum(steps, axis=1)], axis=1)
+        t_stats, _ = batch_engle_granger(fitted[:, None] + walks.T, X)
+        null_t.append(t_stats)
+
+        levels = resid[block_indices(rng, len(resid), block, k)]
+        _, boot_hedges = batch_engle_granger(fitted[:, None] + levels.T, X)
+        hedges.append(boot_hedges)
+
+    null_t, hedges = np.concatenate(null_t), np.concatenate(hedges)
+    p_value = (1 + np.count_nonzero(null_t <= t_obs)) / (resamples + 1)
+    tail = (1 - HEDGE_CI_LEVEL) / 2
+    ci_low, ci_high = np.quantile(hedges, [tail, 1 - tail])
+    return t_obs, p_value, ci_low, ci_high
+
+
+_worker_data = {}
+
+
+def _init_worker(series, segments, resamples, block):
+    _worker_data.update(series=series, segments=segments, resamples=resamples, block=block)
+
+
+def _bootstrap_task(task):
+    i, j, seed = task
+    series, segments = _worker_data["series"], _worker_data["segments"]
+    lo, hi = pair_window(series, segments, i, j)
+    y = np.asarray(series[i][lo:hi], dtype=np.float64)
+    x = np.asarray(series[j][lo:hi], dtype=np.float64)
+    return bootstrap_pair(y, x, _worker_data["resamples"], _worker_data["block"], seed)
+
+
+def bootstrap_significance(results_file=RESULTS_FILE, resamples=BOOTSTRAP_RESAMPLES, block=BOOTSTRAP_BLOCK_BARS,
+                           workers=None, seed=BOOTSTRAP_SEED):
+    """Add bootstrap p-values and hedge-ratio intervals for every pair in the results CSV
+
+    Pairs are spread over a process pool. Each pair gets its own seed derived from seed and
+    its row, so results do not depend on the number of workers.
+    """
+    df_coint = pd.read_csv(results_file)
+    if df_coint.empty:
+        print("⚠️ No pairs to bootstrap")
+        return df_coint
+
+    symbols, series, segments = load_clean_series()
+    if symbols is None:
+        return None
+    column_of = {symbol: k for k, symbol in enumerate(symbols)}
+    known = df_coint["sym_1"].isin(column_of) & df_coint["sym_2"].isin(column_of)
+
+    seeds = np.random.SeedSequence(seed).spawn(len(df_coint))
+    tasks = [(column_of[row.sym_1], column_of[row.sym_2], seeds[k])
+             for k, row in enumerate(df_coint.itertuples()) if known.iloc[k]]
+
+    print(f"🎲 Bootstrapping {len(tasks)} pairs x {resamples} resamples (blocks of {block} bars)...")
+    with Pool(workers, initializer=_init_worker, initargs=(series, segments, resamples, block)) as pool:
+        results = list(tqdm(pool.imap(_bootstrap_task, tasks, chunksize=4), total=len(tasks), desc="Bootstrap"))
+
+    values = np.full((len(df_coint), len(BOOTSTRAP_COLUMNS)), np.nan)
+    values[known.to_numpy()] = np.array(results).reshape(-1, len(BOOTSTRAP_COLUMNS))
+    for k, column in enumerate(BOOTSTRAP_COLUMNS):
+        df_coint[column] = values[:, k]
+    df_coint.to_csv(results_file, index=False)
+
+    significant = int((df_coint["boot_p_value"] < 0.05).sum())
+    print(f"✅ Bootstrap p < 0.05 for {significant} of {len(df_coint)} pairs, saved to {results_file}")
+    return df_coint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Block-bootstrap significance for the flagged pairs")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--resamples", type=int, default=BOOTSTRAP_RESAMPLES)
+    parser.add_argument("--block", type=int, default=BOOTSTRAP_BLOCK_BARS, help="block length in bars")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=BOOTSTRAP_SEED)
+    args = parser.parse_args()
+    bootstrap_significance(args.results, args.resamples, args.block, args.workers, args.seed)
@@ -5,10 +5,49 @@ import pandas as pd
 import numpy as np
 import math
 import json
+import os
+import argparse
+import hashlib
+import sqlite3
+import tempfile
+import time
+from functools import partial
+from multiprocessing import Pool
 from tqdm import tqdm
+import profiling
+from profiling import profiled
+from price_cleaning import BAR_SECONDS, GAP_FILL_POLICY, MAX_FILL_BARS, clean_close_panel
+from price_store import (CLOSE, START_AT, VOLUME, NUMPY_FILE, LEGACY_JSON_FILE, convert_legacy_json,
+                         iter_legacy_json)
+from results_store import HISTORY_DB, record_run
+from universe_filter import MIN_DAILY_DOLLAR_VOLUME, MIN_PRICE, MAX_PRICE, select_universe
 
 z_score_window = 21
 
+# Result files
+RESULTS_FILE = "2_cointegrated_pairs.csv"
+SHARD_RESULTS_FILE = "2_cointegrated_pairs.shard-{k}-of-{n}.csv"
+CHECKPOINT_FILE = "{results}.checkpoint.jsonl"
+CHECKPOINT_BLOCK = 2000  # pairs per checkpoint record
+RESULT_COLUMNS = ["sym_1", "sym_2", "p_value", "t_value", "c_value", "hedge_ratio", "zero_crossings"]
+# Symmetric mode adds the fast one-lag EG t of each direction, in the reported symbol order
+SYMMETRIC_COLUMNS = ["eg_t_1_on_2", "eg_t_2_on_1"]
+
+# Float32 screening: pairs whose fast log-price EG t-stat is below this go on to the float64 test.
+# Looser than the ~-3.34 5% critical value so the screen keeps recall.
+SCREEN_T_THRESHOLD = -2.5
+
+# Cascade screening: the same fast test on every CASCADE_DECIMATE-th bar only (daily closes of the
+# hourly panel, a few hundred points), with a looser threshold since fewer points give weaker
+# t-stats. Windows with fewer than CASCADE_MIN_POINTS decimated points skip the screen.
+CASCADE_DECIMATE = 24
+CASCADE_T_THRESHOLD = -2.0
+CASCADE_MIN_POINTS = 30
+
+# Columns per batch_engle_granger() call in the screen; bounds its temporaries to a few
+# n_bars x SCREEN_BATCH_COLUMNS arrays instead of a few copies of the whole panel
+SCREEN_BATCH_COLUMNS = 64
+
 
 def calculate_zscore(spread):
     df = pd.DataFrame(spread, columns=['spread'])
@@ -46,7 +85,7 @@ def calculate_cointegration(series_1, series_2):
     # FIXED: Proper OLS with constant
     series_2_with_const = sm.add_constant(series_2)
     model = sm.OLS(series_1, series_2_with_const).fit()
-    hedge_ratio = model.params[1]  # CORRECTION: Use the SECOND parameter for slope
+    hedge_ratio = model.params.iloc[1]  # CORRECTION: Use the SECOND parameter for slope
 
     spread = calculate_spread(series_1, series_2, hedge_ratio)
     zero_crossings = len(np.where(np.diff(np.sign(spread)))[0])
@@ -58,6 +97,25 @@ def calculate_cointegration(series_1, series_2):
             round(critical_value, 4), round(hedge_ratio, 4), zero_crossings)
 
 
+def calculate_cointegration_symmetric(series_1, series_2):
+    """calculate_cointegration() in whichever direction has the stronger Engle-Granger statistic
+
+    Both directions' one-lag t come from one set of shared cross-products (engle_granger_both),
+    so only the chosen direction pays for the full coint() test. Returns the usual tuple plus
+    (reverse, t_1_on_2, t_2_on_1); reverse means series_2 was regressed on series_1.
+    """
+    y = pd.Series(series_1).dropna().to_numpy(dtype=np.float64)
+    x = pd.Series(series_2).dropna().to_numpy(dtype=np.float64)
+    min_len = min(len(y), len(x))
+    if min_len < 30:
+        return (0, 1.0, 0, 0, 0, 0, False, np.nan, np.nan)
+
+    t_forward, t_reverse = engle_granger_both(y[:min_len], x[:min_len])
+    reverse = bool(t_reverse < t_forward)
+    result = calculate_cointegration(x, y) if reverse else calculate_cointegration(y, x)
+    return (*result, reverse, t_forward, t_reverse)
+
+
 def extract_close_prices(prices):
     close_prices = []
     for price_values in prices:
@@ -67,68 +125,382 @@ def extract_close_prices(prices):
     return close_prices
 
 
-def get_cointegrated_pairs_corrected(prices):
-    """Corrected version with proper pair comparison logic"""
-    coint_pair_list = []
-    included_set = set()  # Use set for O(1) lookups
+def pair_count(n_symbols):
+    return n_symbols * (n_symbols - 1) // 2
 
-    # Convert to list for proper indexing
-    symbols = list(prices.keys())
-    print(f"Analyzing {len(symbols)} symbols...")
 
-    total_pairs = len(symbols) * (len(symbols) - 1) // 2
-    progress_bar = tqdm(total=total_pairs, desc="Checking pairs")
-
-    for i, sym_1 in enumerate(symbols):
-        # Get close prices once per symbol
-        series_1 = extract_close_prices(prices[sym_1])
-        if len(series_1) < 30:
-            progress_bar.update(len(symbols) - i - 1)  # Update progress for skipped pairs
-            continue
+def parse_shard(spec):
+    """Parse a "k/N" shard spec (1-based) into (k, n)"""
+    try:
+        k, n = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {spec!r}, expected k/N")
+    if n < 1 or not 1 <= k <= n:
+        raise ValueError(f"Invalid shard spec {spec!r}, need 1 <= k <= N")
+    return k, n
+
+
+def shard_bounds(total_pairs, k, n):
+    """Half-open [start, stop) slice of the pair index space owned by shard k of n"""
+    return (k - 1) * total_pairs // n, k * total_pairs // n
+
+
+def iter_pair_range(n_symbols, start, stop):
+    """Yield (i, j) for linear pair indexes start..stop-1 in (0,1), (0,2) ... (1,2) ... order"""
+    i, row_start = 0, 0
+    while i < n_symbols - 1 and row_start + (n_symbols - 1 - i) <= start:
+        row_start += n_symbols - 1 - i
+        i += 1
+
+    p = start
+    j = i + 1 + (start - row_start)
+    while p < stop and i < n_symbols - 1:
+        yield i, j
+        p += 1
+        j += 1
+        if j == n_symbols:
+            i += 1
+            j = i + 1
+
+
+def pair_index(n_symbols, i, j):
+    """Linear index of pair (i, j), i < j, in iter_pair_range order"""
+    return i * (2 * n_symbols - i - 1) // 2 + (j - i - 1)
+
+
+def data_fingerprint(symbols, series, start, stop, mode=""):
+    """Hash of the scan inputs, used to decide whether a checkpoint can be resumed"""
+    digest = hashlib.sha1(f"{start}:{stop}:{mode}".encode())
+    for symbol, values in zip(symbols, series):
+        digest.update(symbol.encode())
+        digest.update(np.asarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def load_checkpoint(checkpoint_file, fingerprint, start):
+    """Return (resume_at, partial results) from an append-only checkpoint, or (start, []) if unusable"""
+    if not os.path.exists(checkpoint_file):
+        return start, []
+
+    resume_at, coint_pair_list = start, []
+    with open(checkpoint_file, "r") as f:
+        for line_no, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # Torn write from a crash mid-append, keep what came before
+
+            if line_no == 0:
+                if record.get("fingerprint") != fingerprint:
+                    print(f"⚠️ Checkpoint {checkpoint_file} is for different input data, starting fresh")
+                    return start, []
+                continue
 
-        for sym_2 in symbols[i + 1:]:  # Only compare with subsequent symbols
+            resume_at = record["block_end"]
+            coint_pair_list.extend(record["pairs"])
+
+    if resume_at > start:
+        print(f"♻️ Resuming from checkpoint at pair {resume_at} with {len(coint_pair_list)} pairs found")
+    return resume_at, coint_pair_list
+
+
+def append_checkpoint(checkpoint_file, record, truncate=False):
+    with open(checkpoint_file, "w" if truncate else "a") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def pair_window(series, segments, i, j):
+    """Bars [lo, hi) that pair (i, j) is tested on
+
+    With cleaning segments, this is the overlap of both symbols' longest valid runs on the
+    aligned panel; without, the first min(len_1, len_2) bars as before.
+    """
+    if segments is None:
+        return 0, min(len(series[i]), len(series[j]))
+    return max(segments[i, 0], segments[j, 0]), min(segments[i, 1], segments[j, 1])
+
+
+def scan_pair_range(symbols, series, start, stop, desc="Checking pairs", position=0, checkpoint_file=None,
+                    progress=None, candidates=None, segments=None, screen=None, symmetric=False):
+    """Test pairs start..stop-1 of the symbol universe and return the cointegrated ones
+
+    With checkpoint_file set, every completed block of CHECKPOINT_BLOCK pairs is appended to it,
+    and a rerun on the same input data resumes after the last completed block. progress, if
+    given, is called as progress(pairs_done, pairs_total, "scan"). candidates, if given, is a set
+    of (i, j) pairs from a screen; all other pairs are skipped, and screen names the screen so a
+    checkpoint from a different one is not resumed. segments, from clean_series(), restricts each
+    pair to the overlap of its symbols' valid bars (see pair_window). symmetric tests each pair in
+    its stronger direction (calculate_cointegration_symmetric), so sym_1 is always the dependent leg.
+    """
+    resume_at, coint_pair_list = start, []
+    if checkpoint_file:
+        mode = screen or ("screened" if candidates is not None else "")
+        if symmetric:
+            mode += ":symmetric"
+        fingerprint = data_fingerprint(symbols, series, start, stop, mode)
+        resume_at, coint_pair_list = load_checkpoint(checkpoint_file, fingerprint, start)
+        if resume_at == start:
+            coint_pair_list = []
+            append_checkpoint(checkpoint_file, {"fingerprint": fingerprint, "start": start, "stop": stop},
+                              truncate=True)
+
+    progress_bar = tqdm(total=stop - start, initial=resume_at - start, desc=desc, position=position)
+
+    for block_start in range(resume_at, stop, CHECKPOINT_BLOCK):
+        block_end = min(block_start + CHECKPOINT_BLOCK, stop)
+        block_pairs = []
+
+        for i, j in iter_pair_range(len(symbols), block_start, block_end):
             progress_bar.update(1)
+            if progress is not None:
+                progress(progress_bar.n, stop - start, "scan")
 
-            # Create unique pair identifier
-            unique = "".join(sorted([sym_1, sym_2]))
-
-            # Skip if already processed
-            if unique in included_set:
+            if candidates is not None and (i, j) not in candidates:
                 continue
 
-            # Get close prices for second symbol
-            series_2 = extract_close_prices(prices[sym_2])
-            if len(series_2) < 30:
+            lo, hi = pair_window(series, segments, i, j)
+            if hi - lo < 30:
                 continue
 
-            # Check cointegration
-            coint_flag, p_value, t_value, c_value, hedge_ratio, zero_crossings = calculate_cointegration(
-                series_1, series_2
-            )
+            if symmetric:
+                (coint_flag, p_value, t_value, c_value, hedge_ratio, zero_crossings,
+                 reverse, t_forward, t_reverse) = calculate_cointegration_symmetric(series[i][lo:hi], series[j][lo:hi])
+            else:
+                coint_flag, p_value, t_value, c_value, hedge_ratio, zero_crossings = calculate_cointegration(
+                    series[i][lo:hi], series[j][lo:hi]
+                )
 
             if coint_flag == 1:
-                included_set.add(unique)
-                coint_pair_list.append({
-                    "sym_1": sym_1,
-                    "sym_2": sym_2,
-                    "p_value": p_value,
-                    "t_value": t_value,
-                    "c_value": c_value,
-                    "hedge_ratio": hedge_ratio,
+                pair = {
+                    "sym_1": symbols[i], "sym_2": symbols[j],
+                    "p_value": p_value, "t_value": t_value,
+                    "c_value": c_value, "hedge_ratio": hedge_ratio,
                     "zero_crossings": zero_crossings
-                })
+                }
+                if symmetric and reverse:
+                    pair.update(sym_1=symbols[j], sym_2=symbols[i], eg_t_1_on_2=t_reverse, eg_t_2_on_1=t_forward)
+                elif symmetric:
+                    pair.update(eg_t_1_on_2=t_forward, eg_t_2_on_1=t_reverse)
+                block_pairs.append(pair)
+
+        coint_pair_list.extend(block_pairs)
+        if checkpoint_file:
+            append_checkpoint(checkpoint_file, {"block_end": block_end, "pairs": block_pairs})
 
     progress_bar.close()
+    return coint_pair_list
+
+
+def spill_series(series):
+    """Copy close series into a temporary file-backed (n_symbols, n_bars) memmap, one row per symbol
+
+    Screened scans use this so the float32 log panel is the in-memory working set; the float64
+    closes are paged back in only for the pairs that reach the full test.
+    """
+    lengths = [len(values) for values in series]
+    if not lengths or max(lengths) == 0:
+        return series
+    spilled = np.memmap(tempfile.TemporaryFile(), dtype=np.float64, mode="w+", shape=(len(series), max(lengths)))
+    for k, values in enumerate(series):
+        spilled[k, :lengths[k]] = values
+    return [spilled[k, :lengths[k]] for k in range(len(series))]
+
+
+def build_log_price_panel(series, dtype=np.float32):
+    """Stack close series into an (n_bars, n_symbols) log-price panel, NaN-padded at the end"""
+    lengths = np.array([len(values) for values in series], dtype=np.int64)
+    panel = np.full((lengths.max(initial=0), len(series)), np.nan, dtype=dtype)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k, values in enumerate(series):
+            panel[:lengths[k], k] = np.log(np.asarray(values, dtype=np.float64))
+    return panel, lengths
+
+
+def batch_engle_granger(y, X):
+    """Fast Engle-Granger approximation of y against every column of X at once
+
+    OLS with constant, then a one-lag ADF regression (no constant) on each residual series,
+    all in the dtype of the inputs. y may also be an (n_bars, k) matrix paired column by column
+    with X (either side may have a single column). Returns (t_stats, hedge_ratios), one per column.
+    """
+    if y.ndim == 1:
+        y = y[:, None]
+    x_c = X - X.mean(axis=0)
+    y_c = y - y.mean(axis=0)
+    hedge_ratios = (x_c * y_c).sum(axis=0) / (x_c * x_c).sum(axis=0)
+    resid = y_c - x_c * hedge_ratios
+
+    # Δe_t = γ·e_{t-1} + φ·Δe_{t-1} + u_t, solved per column from its 2x2 normal equations
+    diff = np.diff(resid, axis=0)
+    lagged, lagged_diff, target = resid[1:-1], diff[:-1], diff[1:]
+    s_aa = (lagged * lagged).sum(axis=0)
+    s_ab = (lagged * lagged_diff).sum(axis=0)
+    s_bb = (lagged_diff * lagged_diff).sum(axis=0)
+    s_ay = (lagged * target).sum(axis=0)
+    s_by = (lagged_diff * target).sum(axis=0)
+    s_yy = (target * target).sum(axis=0)
+    return one_lag_adf_t(s_aa, s_ab, s_bb, s_ay, s_by, s_yy, len(target)), hedge_ratios
+
+
+def eg_ols_terms(ones, y, x):
+    """Hedge regression terms [1, y, x]"""
+    return np.stack([ones, y, x], axis=-1)
+
+
+def eg_adf_row(y0, x0, y1, x1, y2, x2):
+    """Residual ADF regression terms [1, y_{t-1}, x_{t-1}, Δy_{t-1}, Δx_{t-1}, Δy_t, Δx_t] for bar t = 2"""
+    return np.stack([np.ones_like(y1), y1, x1, y1 - y0, x1 - x0, y2 - y1, x2 - x1], axis=-1)
+
+
+def eg_moments(y, x):
+    """Cross-product sums of both Engle-Granger regressions for (n_bars, k) y and x
+
+    Returns ((k, 3, 3) hedge regression sums, (k, 7, 7) ADF sums). Everything the test needs in
+    either direction is in these; see eg_t_from_moments() and EG_SWAP_OLS / EG_SWAP_ADF.
+    """
+    terms = eg_ols_terms(np.ones_like(y), y, x)
+    rows = eg_adf_row(y[:-2], x[:-2], y[1:-1], x[1:-1], y[2:], x[2:])
+    return np.einsum("tpi,tpj->pij", terms, terms), np.einsum("tpi,tpj->pij", rows, rows)
+
+
+# Index orders that swap y and x in eg_moments() sums, giving the x-on-y direction
+EG_SWAP_OLS = [0, 2, 1]
+EG_SWAP_ADF = [0, 2, 1, 4, 3, 6, 5]
+
+
+def swap_eg_direction(ols_sums, adf_sums):
+    return ols_sums[:, EG_SWAP_OLS][:, :, EG_SWAP_OLS], adf_sums[:, EG_SWAP_ADF][:, :, EG_SWAP_ADF]
+
+
+def eg_t_from_moments(ols_sums, adf_sums, n_obs):
+    """(t_stats, hedge_ratios) of y on x from eg_moments() sums; same as batch_engle_granger()
+
+    n_obs is the number of ADF regression rows (bars - 2).
+    """
+    n, sum_y, sum_x = ols_sums[:, 0, 0], ols_sums[:, 0, 1], ols_sums[:, 0, 2]
+    s_xx = ols_sums[:, 2, 2] - sum_x * sum_x / n
+    s_xy = ols_sums[:, 1, 2] - sum_x * sum_y / n
+    hedge_ratios = s_xy / s_xx
+    intercepts = (sum_y - hedge_ratios * sum_x) / n
+
+    # Residual e = y - intercept - hedge * x, so each ADF sum is a quadratic form in the moments
+    zeros, ones = np.zeros_like(n), np.ones_like(n)
+    lagged = np.stack([-intercepts, ones, -hedge_ratios, zeros, zeros, zeros, zeros], axis=1)
+    lagged_diff = np.stack([zeros, zeros, zeros, ones, -hedge_ratios, zeros, zeros], axis=1)
+    target = np.stack([zeros, zeros, zeros, zeros, zeros, ones, -hedge_ratios], axis=1)
+
+    def moment(a, b):
+        return np.einsum("pi,pij,pj->p", a, adf_sums, b)
+
+    t_stats = one_lag_adf_t(moment(lagged, lagged), moment(lagged, lagged_diff), moment(lagged_diff, lagged_diff),
+                            moment(lagged, target), moment(lagged_diff, target), moment(target, target), n_obs)
+    return t_stats, hedge_ratios
+
+
+def engle_granger_both(y, x):
+    """One-lag Engle-Granger t of y on x and of x on y, from one set of shared cross-products"""
+    y = np.asarray(y, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    ols_sums, adf_sums = eg_moments((y - y.mean())[:, None], (x - x.mean())[:, None])
+    t_forward, _ = eg_t_from_moments(ols_sums, adf_sums, len(y) - 2)
+    t_reverse, _ = eg_t_from_moments(*swap_eg_direction(ols_sums, adf_sums), len(y) - 2)
+    return t_forward[0], t_reverse[0]
+
+
+def one_lag_adf_t(s_aa, s_ab, s_bb, s_ay, s_by, s_yy, n_obs):
+    """t-stat of γ in Δe_t = γ·e_{t-1} + φ·Δe_{t-1} from the regression's cross-product sums
+
+    a = e_{t-1}, b = Δe_{t-1}, y = Δe_t; n_obs is the number of regression rows.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        det = s_aa * s_bb - s_ab * s_ab
+        gamma = (s_bb * s_ay - s_ab * s_by) / det
+        phi = (s_aa * s_by - s_ab * s_ay) / det
+        sigma2 = (s_yy - gamma * s_ay - phi * s_by) / (n_obs - 2)
+        return gamma / np.sqrt(sigma2 * s_bb / det)
+
+
+def screen_pairs(symbols, series, start, stop, dtype=np.float32, threshold=SCREEN_T_THRESHOLD, segments=None,
+                 decimate=1, min_points=CASCADE_MIN_POINTS, symmetric=False):
+    """Return the (i, j) pairs in start..stop-1 that pass the fast log-price EG screen
+
+    With decimate > 1 the test only sees every decimate-th bar of each pair's window, counted back
+    from its last bar; pairs left with fewer than min_points bars pass unscreened. With symmetric,
+    a pair passes if either direction does.
+    """
+    n_symbols = len(symbols)
+    candidates = set()
+    if stop <= start:
+        return candidates
+
+    panel, lengths = build_log_price_panel(series, dtype)
+    first_row = next(iter_pair_range(n_symbols, start, start + 1))[0]
+    last_row = next(iter_pair_range(n_symbols, stop - 1, stop))[0]
+
+    desc = f"Screening ({np.dtype(dtype).name}" + (f", every {decimate} bars)" if decimate > 1 else ")")
+    for i in tqdm(range(first_row, last_row + 1), desc=desc):
+        js = np.arange(i + 1, n_symbols)
+        in_range = (pair_index(n_symbols, i, js) >= start) & (pair_index(n_symbols, i, js) < stop)
+        js = js[in_range]
+
+        # Same windows as pair_window(), batched by window
+        if segments is None:
+            lo = np.zeros(len(js), dtype=np.int64)
+            hi = np.minimum(lengths[js], lengths[i])
+        else:
+            lo = np.maximum(segments[js, 0], segments[i, 0])
+            hi = np.minimum(segments[js, 1], segments[i, 1])
+        keep = hi - lo >= 30
+        js, lo, hi = js[keep], lo[keep], hi[keep]
+
+        windows = np.stack([lo, hi], axis=1)
+        for window_lo, window_hi in np.unique(windows, axis=0):
+            group = js[(lo == window_lo) & (hi == window_hi)]
+            window = panel[window_lo:window_hi][::-1][::decimate][::-1]
+            if decimate > 1 and len(window) < min_points:
+                candidates.update((i, int(j)) for j in group)
+                continue
+            for batch_start in range(0, len(group), SCREEN_BATCH_COLUMNS):
+                batch = group[batch_start:batch_start + SCREEN_BATCH_COLUMNS]
+                t_stats, _ = batch_engle_granger(window[:, i], window[:, batch])
+                if symmetric:
+                    t_stats = np.minimum(t_stats, batch_engle_granger(window[:, batch], window[:, [i]])[0])
+                candidates.update((i, int(j)) for j in batch[t_stats < threshold])
+
+    return candidates
+
+
+def save_pairs_csv(coint_pair_list, filename):
+    """Sort pairs by zero crossings and write them to CSV (stable, so shard merges match a full run)"""
+    extra = [column for column in SYMMETRIC_COLUMNS if coint_pair_list and column in coint_pair_list[0]]
+    df_coint = pd.DataFrame(coint_pair_list, columns=RESULT_COLUMNS + extra)
+    df_coint = df_coint.sort_values("zero_crossings", ascending=False, kind="mergesort")
+    df_coint.to_csv(filename, index=False)
+    return df_coint
+
+
+@profiled("get_cointegrated_pairs_corrected")
+def get_cointegrated_pairs_corrected(prices):
+    """Corrected version with proper pair comparison logic"""
+    # Convert to list for proper indexing
+    symbols = list(prices.keys())
+    print(f"Analyzing {len(symbols)} symbols...")
+
+    # Align and clean close prices once for all symbols
+    arrays = [candles_to_arrays(prices[symbol]) for symbol in symbols]
+    series, segments = clean_series(symbols, [times for times, _, _ in arrays], [values for _, values, _ in arrays])
+    coint_pair_list = scan_pair_range(symbols, series, 0, pair_count(len(symbols)), segments=segments)
 
     # Output results
     if coint_pair_list:
-        df_coint = pd.DataFrame(coint_pair_list)
-        df_coint = df_coint.sort_values("zero_crossings", ascending=False)
-        df_coint.to_csv("2_cointegrated_pairs.csv", index=False)
+        df_coint = save_pairs_csv(coint_pair_list, RESULTS_FILE)
         print(f"✅ Found {len(coint_pair_list)} cointegrated pairs")
     else:
         df_coint = pd.DataFrame()
         print("❌ No cointegrated pairs found")
+    record_history(coint_pair_list, "corrected", symbols=len(symbols), pairs_tested=pair_count(len(symbols)))
 
     return df_coint
 
@@ -154,89 +526,355 @@ def load_numpy_data(filename="1_price_list_numpy.npz"):
         return None
 
 
-def get_cointegrated_pairs_numpy(numpy_data):
+@profiled("get_cointegrated_pairs_numpy")
+def get_cointegrated_pairs_numpy(numpy_data, results_file="2_cointegrated_pairs_numpy.csv"):
     """Cointegration analysis for NumPy data"""
     symbols = list(numpy_data.keys())
-    coint_pair_list = []
-    included_set = set()
 
-    total_pairs = len(symbols) * (len(symbols) - 1) // 2
-    progress_bar = tqdm(total=total_pairs, desc="Checking pairs (NumPy)")
+    # Extract close prices from NumPy array (column 3) and align them on one clean panel
+    arrays = [store_to_arrays(numpy_data[symbol]) for symbol in symbols]
+    series, segments = clean_series(symbols, [times for times, _, _ in arrays], [values for _, values, _ in arrays])
+    checkpoint_file = CHECKPOINT_FILE.format(results=results_file)
+    coint_pair_list = scan_pair_range(symbols, series, 0, pair_count(len(symbols)),
+                                      desc="Checking pairs (NumPy)", checkpoint_file=checkpoint_file,
+                                      segments=segments)
 
-    for i, sym_1 in enumerate(symbols):
-        # Extract close prices from NumPy array (column 3)
-        series_1 = numpy_data[sym_1][:, 3]
-        if len(series_1) < 30:
-            progress_bar.update(len(symbols) - i - 1)
-            continue
+    if coint_pair_list:
+        df_coint = save_pairs_csv(coint_pair_list, results_file)
+        print(f"✅ Found {len(coint_pair_list)} cointegrated pairs")
+    else:
+        df_coint = pd.DataFrame()
+        print("❌ No cointegrated pairs found")
 
-        for sym_2 in symbols[i + 1:]:
-            progress_bar.update(1)
+    os.remove(checkpoint_file)
+    record_history(coint_pair_list, "numpy", symbols=len(symbols), pairs_tested=pair_count(len(symbols)))
+    return df_coint
 
-            unique = "".join(sorted([sym_1, sym_2]))
-            if unique in included_set:
-                continue
 
-            series_2 = numpy_data[sym_2][:, 3]
-            if len(series_2) < 30:
-                continue
+def candles_to_arrays(candles):
+    """(start_at, close, volume) arrays from a list of candle dicts; volume is NaN if not recorded"""
+    start_ats = np.array([candle["start_at"] for candle in candles], dtype=np.int64)
+    closes = np.array([candle["close"] for candle in candles], dtype=np.float64)
+    volumes = np.array([candle.get("volume") for candle in candles], dtype=np.float64)
+    return start_ats, closes, volumes
+
+
+def store_to_arrays(array):
+    """(start_at, close, volume) arrays from a NumPy store array
+
+    Arrays without a start_at column are assumed to be contiguous bars ending at the same time;
+    arrays without a volume column get NaN volume.
+    """
+    volumes = array[:, VOLUME] if array.shape[1] > VOLUME else np.full(len(array), np.nan)
+    if array.shape[1] > START_AT:
+        return array[:, START_AT].astype(np.int64), array[:, CLOSE], volumes
+    return (np.arange(len(array)) - len(array)) * BAR_SECONDS, array[:, CLOSE], volumes
+
+
+def clean_series(symbols, start_ats, closes):
+    """Clean closes into aligned panel columns plus each symbol's longest valid segment"""
+    panel, segments, stats = clean_close_panel(start_ats, closes)
+    print(f"🧹 Cleaned {len(symbols)} symbols on {stats['bars']} hourly bars: {stats['missing']} missing, "
+          f"{stats['filled']} filled ({GAP_FILL_POLICY}, up to {MAX_FILL_BARS} bars), "
+          f"{stats['outside_segments']} outside valid segments")
+    return [panel[:, k] for k in range(panel.shape[1])], segments
+
+
+def load_price_arrays(numpy_file="1_price_list_numpy.npz", json_file="1_price_list.json"):
+    """Load (symbols, start_ats, closes, volumes) per symbol, NumPy store first, then JSON"""
+    if os.path.exists(numpy_file):
+        numpy_prices = load_numpy_data(numpy_file)
+        if numpy_prices is not None:
+            symbols = list(numpy_prices.keys())
+            arrays = [store_to_arrays(numpy_prices[symbol]) for symbol in symbols]
+            return (symbols, [a[0] for a in arrays], [a[1] for a in arrays], [a[2] for a in arrays])
+
+    # The JSON dump is streamed symbol by symbol instead of parsed whole
+    if not os.path.exists(json_file):
+        print("❌ Error: No price data files found!")
+        return None, None, None, None
+
+    symbols, start_ats, closes, volumes = [], [], [], []
+    for symbol, array in iter_legacy_json(json_file):
+        times, values, volume = store_to_arrays(array)
+        symbols.append(symbol)
+        start_ats.append(times)
+        closes.append(values)
+        volumes.append(volume)
+    return symbols, start_ats, closes, volumes
+
+
+def load_clean_series(numpy_file="1_price_list_numpy.npz", json_file="1_price_list.json"):
+    """Load closes as (symbols, aligned panel columns, valid segments), NumPy store first, then JSON"""
+    symbols, start_ats, closes, _ = load_price_arrays(numpy_file, json_file)
+    if symbols is None:
+        return None, None, None
+    series, segments = clean_series(symbols, start_ats, closes)
+    return symbols, series, segments
+
+
+def filter_universe(symbols, series, segments, start_ats, volumes, min_dollar_volume=MIN_DAILY_DOLLAR_VOLUME,
+                    min_price=MIN_PRICE, max_price=MAX_PRICE):
+    """Drop illiquid and out-of-range symbols before the O(n²) scan; returns (symbols, series, segments)"""
+    if not symbols:
+        return symbols, series, segments
+
+    keep, stats = select_universe(start_ats, np.column_stack(series), segments, volumes,
+                                  min_dollar_volume, min_price, max_price)
+    kept = np.flatnonzero(keep)
+    pairs_before, pairs_after = pair_count(len(symbols)), pair_count(len(kept))
+    shrink = 100 * (1 - pairs_after / pairs_before) if pairs_before else 0
+    print(f"🧮 Universe filter kept {stats['kept']}/{len(symbols)} symbols "
+          f"({stats['illiquid']} illiquid, {stats['out_of_price_range']} out of price range, "
+          f"{stats['no_volume']} without volume kept): pairs {pairs_before:,} → {pairs_after:,} (-{shrink:.1f}%)")
+    return [symbols[k] for k in kept], [series[k] for k in kept], segments[kept]
+
+
+@profiled("calculate_cointegrated_pairs")
+def calculate_cointegrated_pairs(shard=None, progress=None, float32=False, cascade=False, symmetric=False,
+                                 min_dollar_volume=MIN_DAILY_DOLLAR_VOLUME, min_price=MIN_PRICE, max_price=MAX_PRICE):
+    """Scan all pairs (or one "k/N" shard of them) and write the results CSV
+
+    Symbols first go through the liquidity and price-level universe filter (min_dollar_volume=0
+    and min_price=0 disable it). With float32=True, pairs are then screened on a float32
+    log-price panel, and with cascade=True on a daily-decimated one (in float32 if both are set);
+    only the candidates get the float64 calculate_cointegration() test that decides coint_flag.
+    symmetric=True tests every pair in both directions and keeps the stronger one.
+    """
+    symbols, series, segments = scan_inputs(min_dollar_volume, min_price, max_price)
+    if symbols is None:
+        return False
+
+    total_pairs = pair_count(len(symbols))
+    if shard is None:
+        start, stop = 0, total_pairs
+        filename, desc, position = RESULTS_FILE, "Checking pairs", 0
+    else:
+        k, n = parse_shard(shard)
+        start, stop = shard_bounds(total_pairs, k, n)
+        filename = SHARD_RESULTS_FILE.format(k=k, n=n)
+        desc, position = f"Shard {k}/{n}", k - 1
+
+    print(f"Analyzing {len(symbols)} symbols, pairs {start}..{stop} of {total_pairs}...")
+    candidates, screen = None, None
+    if float32 or cascade:
+        series = spill_series(series)  # drops the in-memory float64 panel
+        screen_options = screen_settings(float32, cascade)
+        screen = "+".join(name for name, used in (("float32", float32), ("cascade", cascade)) if used)
+        candidates = screen_pairs(symbols, series, start, stop, segments=segments, symmetric=symmetric,
+                                  **screen_options)
+        print(f"🔎 {screen.capitalize()} screen kept {len(candidates)} of {stop - start} pairs")
+
+    checkpoint_file = CHECKPOINT_FILE.format(results=filename)
+    coint_pair_list = scan_pair_range(symbols, series, start, stop, desc=desc, position=position,
+                                      checkpoint_file=checkpoint_file, progress=progress,
+                                      candidates=candidates, segments=segments, screen=screen,
+                                      symmetric=symmetric)
+
+    # Shards always write their file, even when empty, so the merge can tell they finished
+    save_pairs_csv(coint_pair_list, filename)
+    os.remove(checkpoint_file)
+    print(f"✅ Found {len(coint_pair_list)} cointegrated pairs, saved to {filename}")
+
+    # Shard runs are recorded once, by the merge
+    if shard is None:
+        record_history(coint_pair_list, "full", symbols=len(symbols), pairs_tested=total_pairs)
+    return True
+
+
+def scan_inputs(min_dollar_volume=MIN_DAILY_DOLLAR_VOLUME, min_price=MIN_PRICE, max_price=MAX_PRICE):
+    """(symbols, series, segments) a scan runs on: cleaned closes that pass the universe filter"""
+    symbols, start_ats, closes, volumes = load_price_arrays()
+    if symbols is None:
+        return None, None, None
+    series, segments = clean_series(symbols, start_ats, closes)
+    return filter_universe(symbols, series, segments, start_ats, volumes, min_dollar_volume, min_price, max_price)
+
+
+def scan_resumable(results_file=RESULTS_FILE):
+    """True if an interrupted default full scan left checkpointed blocks for the current price store
+
+    A fetch adds bars and invalidates the checkpoint, so the pipeline checks this before fetching.
+    """
+    checkpoint_file = CHECKPOINT_FILE.format(results=results_file)
+    if not os.path.exists(checkpoint_file):
+        return False
+    with open(checkpoint_file, "r") as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return False
+        if not f.readline():
+            return False  # No completed block yet, nothing to save by resuming
 
-            # Ensure same length
-            min_length = min(len(series_1), len(series_2))
-            series_1_trimmed = series_1[:min_length]
-            series_2_trimmed = series_2[:min_length]
+    symbols, series, _ = scan_inputs()
+    if not symbols:
+        return False
+    return header.get("fingerprint") == data_fingerprint(symbols, series, 0, pair_count(len(symbols)))
 
-            coint_flag, p_value, t_value, c_value, hedge_ratio, zero_crossings = calculate_cointegration(
-                series_1_trimmed, series_2_trimmed
-            )
 
-            if coint_flag == 1:
-                included_set.add(unique)
-                coint_pair_list.append({
-                    "sym_1": sym_1, "sym_2": sym_2,
-                    "p_value": p_value, "t_value": t_value,
-                    "c_value": c_value, "hedge_ratio": hedge_ratio,
-                    "zero_crossings": zero_crossings
-                })
+def screen_settings(float32=False, cascade=False):
+    """screen_pairs() options for the float32 screen, the cascade, or both"""
+    options = {"dtype": np.float32 if float32 else np.float64}
+    if cascade:
+        options.update(threshold=CASCADE_T_THRESHOLD, decimate=CASCADE_DECIMATE)
+    return options
 
-    progress_bar.close()
 
-    if coint_pair_list:
-        df_coint = pd.DataFrame(coint_pair_list)
-        df_coint = df_coint.sort_values("zero_crossings", ascending=False)
-        df_coint.to_csv("2_cointegrated_pairs_numpy.csv", index=False)
-        print(f"✅ Found {len(coint_pair_list)} cointegrated pairs")
-    else:
-        df_coint = pd.DataFrame()
-        print("❌ No cointegrated pairs found")
+def record_history(coint_pair_list, source, **run_info):
+    """Append the run to the results history; a history failure never fails the scan"""
+    try:
+        record_run(coint_pair_list, source, **run_info)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not record run in {HISTORY_DB}: {e}")
 
+
+def merge_shard_results(n_shards, output_file=RESULTS_FILE):
+    """Combine the shard CSVs of an N-way scan into the final sorted results file"""
+    shard_files = [SHARD_RESULTS_FILE.format(k=k, n=n_shards) for k in range(1, n_shards + 1)]
+    missing = [filename for filename in shard_files if not os.path.exists(filename)]
+    if missing:
+        print(f"❌ Missing shard results: {', '.join(missing)}")
+        return None
+
+    frames = [pd.read_csv(filename) for filename in shard_files]
+    coint_pair_list = pd.concat(frames, ignore_index=True).to_dict("records")
+    df_coint = save_pairs_csv(coint_pair_list, output_file)
+    print(f"✅ Merged {n_shards} shards: {len(df_coint)} cointegrated pairs saved to {output_file}")
+    record_history(coint_pair_list, f"merge of {n_shards} shards")
     return df_coint
 
 
+def run_local_shards(n_shards, **scan_options):
+    """Emulate an N-node scan with one local process per shard, then merge"""
+    shard_specs = [f"{k}/{n_shards}" for k in range(1, n_shards + 1)]
+    with Pool(n_shards) as pool:
+        results = pool.map(partial(calculate_cointegrated_pairs, **scan_options), shard_specs)
+
+    if not all(results):
+        print("❌ One or more shards failed")
+        return None
+    return merge_shard_results(n_shards)
+
+
+def benchmark_screen(max_symbols=60, float32=False, cascade=False):
+    """Compare a screened scan with the plain float64 scan on the same data, including recall"""
+    symbols, series, segments = load_clean_series()
+    if symbols is None:
+        return None
+    symbols, series, segments = symbols[:max_symbols], series[:max_symbols], segments[:max_symbols]
+    total_pairs = pair_count(len(symbols))
+    label = "+".join(name for name, used in (("float32", float32), ("cascade", cascade)) if used)
+
+    started = time.perf_counter()
+    full_pairs = scan_pair_range(symbols, series, 0, total_pairs, desc="float64", segments=segments)
+    float64_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    candidates = screen_pairs(symbols, series, 0, total_pairs, segments=segments,
+                              **screen_settings(float32, cascade))
+    screen_seconds = time.perf_counter() - started
+    screened_pairs = scan_pair_range(symbols, series, 0, total_pairs, desc=label, candidates=candidates,
+                                     segments=segments)
+    screened_seconds = time.perf_counter() - started
+
+    full = {(pair["sym_1"], pair["sym_2"]): pair for pair in full_pairs}
+    screened = {(pair["sym_1"], pair["sym_2"]): pair for pair in screened_pairs}
+    missed = sorted(set(full) - set(screened))
+    added = sorted(set(screened) - set(full))
+    changed = [key for key in set(full) & set(screened) if full[key] != screened[key]]
+    recall = len(set(full) & set(screened)) / len(full) if full else 1.0
+
+    print(f"\n📊 {label.capitalize()} benchmark on {len(symbols)} symbols ({total_pairs} pairs)")
+    print(f"   float64 scan:  {float64_seconds:.1f}s, {len(full)} cointegrated pairs")
+    print(f"   {label} scan:  {screened_seconds:.1f}s (screen {screen_seconds:.1f}s, "
+          f"{len(candidates)} candidates), {len(screened)} cointegrated pairs")
+    print(f"   speedup:       {float64_seconds / screened_seconds:.1f}x")
+    print(f"   recall:        {recall:.1%}")
+    print(f"   verdict changes: {len(missed)} missed, {len(added)} added, {len(changed)} with different stats")
+    for sym_1, sym_2 in missed:
+        print(f"   missed: {sym_1}/{sym_2} (t={full[(sym_1, sym_2)]['t_value']})")
+
+    return {
+        "symbols": len(symbols), "pairs": total_pairs, "candidates": len(candidates),
+        "float64_seconds": float64_seconds, "screened_seconds": screened_seconds, "recall": recall,
+        "missed": missed, "added": added, "changed": changed,
+    }
+
+
+def benchmark_float32(max_symbols=60):
+    """Compare the float32-screened scan with the plain float64 scan on the same data"""
+    return benchmark_screen(max_symbols, float32=True)
+
+
+def benchmark_cascade(max_symbols=60):
+    """Compare the daily-decimated cascade with the plain float64 scan and report its recall"""
+    return benchmark_screen(max_symbols, cascade=True)
+
+
 # MAIN EXECUTION BLOCK
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cointegration pair scan")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shard", metavar="k/N", help="scan only shard k of N (1-based) and write a shard file")
+    group.add_argument("--merge", metavar="N", type=int, help="merge N shard files into " + RESULTS_FILE)
+    group.add_argument("--local-shards", metavar="N", type=int, help="emulate N nodes locally, then merge")
+    group.add_argument("--benchmark-float32", metavar="SYMBOLS", type=int, nargs="?", const=60,
+                       help="compare float32 screening with the float64 scan on the first SYMBOLS symbols")
+    group.add_argument("--benchmark-cascade", metavar="SYMBOLS", type=int, nargs="?", const=60,
+                       help="report the cascade's speedup and recall against the float64 scan on SYMBOLS symbols")
+    parser.add_argument("--float32", action="store_true",
+                        help="screen pairs on a float32 log-price panel before the float64 test")
+    parser.add_argument("--symmetric", action="store_true",
+                        help="test both regression directions per pair and keep the stronger one")
+    parser.add_argument("--cascade", action="store_true",
+                        help="screen pairs on daily-decimated prices with a looser threshold before the full test")
+    parser.add_argument("--profile", nargs="?", const="all", choices=["all", "cpu", "mem"],
+                        help=f"profile the scan into {profiling.PROFILE_DIR}/ (same as {profiling.PROFILE_ENV}=all|cpu|mem)")
+    parser.add_argument("--min-dollar-volume", type=float, default=MIN_DAILY_DOLLAR_VOLUME,
+                        help="minimum median 24h dollar volume for a symbol to be scanned (0 disables)")
+    parser.add_argument("--min-price", type=float, default=MIN_PRICE, help="minimum last close")
+    parser.add_argument("--max-price", type=float, default=MAX_PRICE, help="maximum last close")
+    args = parser.parse_args()
+    filter_flags = (args.min_dollar_volume, args.min_price, args.max_price)
+    if (args.merge or args.benchmark_float32 or args.benchmark_cascade) and \
+            filter_flags != (MIN_DAILY_DOLLAR_VOLUME, MIN_PRICE, MAX_PRICE):
+        parser.error("--min-dollar-volume/--min-price/--max-price only apply to scans, not --merge or benchmarks")
+    if args.profile:
+        profiling.enable(args.profile)
+    scan_options = {
+        "float32": args.float32,
+        "cascade": args.cascade,
+        "symmetric": args.symmetric,
+        "min_dollar_volume": args.min_dollar_volume,
+        "min_price": args.min_price,
+        "max_price": args.max_price,
+    }
+
     print("🚀 Starting Cointegration Analysis")
     print("=" * 50)
 
-    # Try NumPy first, then JSON
-    numpy_prices = load_numpy_data("1_price_list_numpy.npz")
-
-    if numpy_prices is not None:
-        print("\nUsing NumPy data format...")
-        df_con = get_cointegrated_pairs_numpy(numpy_prices)
+    if args.shard:
+        calculate_cointegrated_pairs(args.shard, **scan_options)
+    elif args.merge:
+        df_con = merge_shard_results(args.merge)
+    elif args.local_shards:
+        df_con = run_local_shards(args.local_shards, **scan_options)
+    elif args.benchmark_float32:
+        benchmark_float32(args.benchmark_float32)
+    elif args.benchmark_cascade:
+        benchmark_cascade(args.benchmark_cascade)
     else:
-        print("\nUsing JSON data format...")
-        try:
-            with open("1_price_list.json", "r") as f:
-                prices_data = json.load(f)
-            df_con = get_cointegrated_pairs_corrected(prices_data)
-        except FileNotFoundError:
-            print("❌ Error: No price data files found!")
-        except Exception as e:
-            print(f"❌ Error: {e}")
-
-    if 'df_con' in locals() and not df_con.empty:
+        # Convert a legacy JSON dump into the binary store once; later runs read the store directly
+        if not os.path.exists(NUMPY_FILE) and os.path.exists(LEGACY_JSON_FILE):
+            print("\nUsing JSON data format...")
+            convert_legacy_json(LEGACY_JSON_FILE, NUMPY_FILE)
+        # Every scan goes through the universe filter and the results history
+        if calculate_cointegrated_pairs(**scan_options):
+            df_con = pd.read_csv(RESULTS_FILE)
+
+    if 'df_con' in locals() and df_con is not None and not df_con.empty:
         print(f"\n🎯 ANALYSIS COMPLETE!")
         print(f"📈 Found {len(df_con)} cointegrated pairs")
         print(f"\n📊 Top pairs:")
-        print(df_con.head()[['sym_1', 'sym_2', 'p_value', 'zero_crossings']])
\ No newline at end of file
+        print(df_con.head()[['sym_1', 'sym_2', 'p_value', 'zero_crossings']])
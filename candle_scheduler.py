@@ -0,0 +1,112 @@
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hourly candles (price_cleaning.BAR_SECONDS); bars close on multiples of this since the epoch
+CANDLE_SECONDS = 3600
+
+# Seconds after a candle close before triggering, so the exchange has published the bar
+CLOSE_DELAY_SECONDS = int(os.environ.get("SCHEDULE_CLOSE_DELAY", 60))
+
+# The full rescan runs on every FULL_RESCAN_EVERY-th candle close (UTC-aligned), the cheap
+# incremental refresh on every other one
+FULL_RESCAN_EVERY = int(os.environ.get("SCHEDULE_FULL_EVERY", 12))
+
+INCREMENTAL = "incremental"
+FULL = "full"
+
+# Last completed slots, so missed runs are caught up after a restart too
+SCHEDULER_STATE_FILE = "scheduler_state.json"
+
+# Longest single sleep, so clock jumps are noticed
+MAX_SLEEP_SECONDS = 300
+
+
+class CandleScheduler:
+    """Run jobs a fixed delay after each candle close, one at a time
+
+    run_job(kind) must block until the job has finished and return whether it succeeded.
+    Since the next trigger is only computed afterwards, runs never overlap; any closes missed
+    while a job ran (or while the process was down) collapse into one catch-up run, which is
+    a full rescan if a full slot was among them.
+    """
+
+    def __init__(self, run_job, period=CANDLE_SECONDS, delay=CLOSE_DELAY_SECONDS, full_every=FULL_RESCAN_EVERY,
+                 state_file=SCHEDULER_STATE_FILE):
+        self.run_job = run_job
+        self.period = period
+        self.delay = delay
+        self.full_every = full_every
+        self.state_file = state_file
+        self.state = self._load_state()
+
+    def slot(self, now):
+        """Index of the latest trigger at or before now"""
+        return int((now - self.delay) // self.period)
+
+    def trigger_time(self, slot):
+        return slot * self.period + self.delay
+
+    def due(self, now):
+        """Kind of run due at now (FULL, INCREMENTAL or None) and the slot it covers"""
+        current = self.slot(now)
+        last_slot = self.state.get("last_slot")
+        if last_slot is not None and current <= last_slot:
+            return None, current
+
+        if last_slot is not None and current - last_slot > 1:
+            logger.info(f"⏭️ Collapsing {current - last_slot - 1} missed scheduled runs into one catch-up")
+
+        last_full_slot = self.state.get("last_full_slot")
+        latest_full_slot = current - current % self.full_every
+        if last_full_slot is None or latest_full_slot > last_full_slot:
+            return FULL, current
+        return INCREMENTAL, current
+
+    def run_pending(self, now=None):
+        """Run whatever is due; returns the kind that ran, or None"""
+        kind, slot = self.due(time.time() if now is None else now)
+        if kind is None:
+            return None
+
+        candle_close = time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(self.trigger_time(slot) - self.delay))
+        logger.info(f"⏰ Running scheduled {kind} job for the {candle_close} candle close")
+        try:
+            success = self.run_job(kind)
+        except Exception as e:
+            logger.error(f"❌ Scheduled {kind} job crashed: {e}")
+            success = False
+
+        # A failed full rescan stays due, so the next trigger retries it
+        self.state["last_slot"] = slot
+        if kind == FULL and success:
+            self.state["last_full_slot"] = slot
+        self._save_state()
+        return kind
+
+    def seconds_until_next(self, now=None):
+        now = time.time() if now is None else now
+        return max(0.0, self.trigger_time(self.slot(now) + 1) - now)
+
+    def run_forever(self):
+        logger.info(f"📅 Scheduler started: refresh {self.delay}s after every candle close, "
+                    f"full rescan every {self.full_every} candles")
+        while True:
+            self.run_pending()
+            time.sleep(min(self.seconds_until_next(), MAX_SLEEP_SECONDS))
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
@@ -3,16 +3,22 @@ import json
 import time
 import os
 import logging
+import queue
+import threading
 from datetime import datetime
+import numpy as np
+from rate_limiter import AdaptiveRateLimiter
+from profiling import profiled, worker_call
+from price_store import NUMPY_FILE, START_AT, PriceStoreWriter, candles_to_array, array_to_candles
+from ws_capture import transport_from_env
+from symbol_health import (load_symbol_health, save_symbol_health, plan_fetch, update_symbol_health,
+                           RESOLVE_FAILED, EMPTY)
 
 logger = logging.getLogger(__name__)
 
 # WebSocket endpoint
 socket = 'wss://data.tradingview.com/socket.io/websocket'
 
-# Global dictionary to store all symbol data
-all_symbols_data = {}
-
 # Your symbols list (truncated for brevity - include your full list)
 symbols = [
     "BTCUSDT",
@@ -593,6 +599,31 @@ symbols = [
 resolution = "60"
 limit = 5000
 
+# Bars per symbol the hourly refresh asks for: the new candle plus slack for missed runs
+REFRESH_BARS = int(os.environ.get("FETCH_REFRESH_BARS", 48))
+
+# Concurrency and retries
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 4))
+MAX_FETCH_ATTEMPTS = 3
+
+# Write completed symbols straight to the NumPy store instead of keeping them in memory
+SPILL_TO_STORE = os.environ.get("FETCH_SPILL_TO_STORE", "").lower() in ("1", "true", "yes")
+
+# Fetch outcomes
+FETCH_OK = "ok"
+FETCH_EMPTY = "empty"
+FETCH_TIMEOUT = "timeout"
+FETCH_THROTTLED = "throttled"
+FETCH_RESOLVE_FAILED = "resolve_failed"
+FETCH_ERROR = "error"
+RETRYABLE_STATUSES = {FETCH_TIMEOUT, FETCH_THROTTLED, FETCH_ERROR}
+
+THROTTLE_MARKERS = ("429", "too many", "rate limit", "throttl")
+
+# Connection factory (symbol -> WebSocket-like object); None opens the live socket.
+# FETCH_CAPTURE_DIR / FETCH_REPLAY_DIR select recording or replay (see ws_capture)
+transport = transport_from_env(socket)
+
 
 def create_msg(ws, fun, arg):
     """Utility to wrap and send TradingView messages"""
@@ -602,12 +633,35 @@ def create_msg(ws, fun, arg):
     ws.send(framed)
 
 
-def fetch_candle_data(symbol):
-    """Fetch candle data for a single symbol"""
+def classify_error(text):
+    """Map a server error frame or exception text to a fetch status"""
+    text = text.lower()
+    if "symbol_error" in text:
+        return FETCH_RESOLVE_FAILED
+    if any(marker in text for marker in THROTTLE_MARKERS):
+        return FETCH_THROTTLED
+    return FETCH_ERROR
+
+
+def set_transport(factory):
+    """Route download_candles() through factory(symbol), or back to the live socket with None"""
+    global transport
+    transport = factory
+
+
+def open_connection(symbol):
+    if transport is not None:
+        return transport(symbol)
+    return websocket.create_connection(socket)
+
+
+def download_candles(symbol, bars=limit):
+    """Fetch the latest bars candles for a single symbol, returning (status, candles)"""
     logger.info(f"📡 Fetching data for {symbol}...")
 
+    ws = None
     try:
-        ws = websocket.create_connection(socket)
+        ws = open_connection(symbol)
         session_id = "cs_vOn7C11YGKmD"
 
         # Step 1: Create chart session
@@ -624,23 +678,27 @@ def fetch_candle_data(symbol):
         create_msg(ws, 'resolve_symbol', [session_id, "sds_sym_1", param])
 
         # Step 3: Create series
-        create_msg(ws, 'create_series', [session_id, "sds_1", "s1", "sds_sym_1", resolution, limit])
+        create_msg(ws, 'create_series', [session_id, "sds_1", "s1", "sds_sym_1", resolution, bars])
 
         # Step 4: Receive and process data
         candle_data = []
         data_received = False
+        status = FETCH_EMPTY
+        series_completed = False
         timeout = 15
         start_time = time.time()
 
-        while True:
+        while not series_completed:
             if time.time() - start_time > timeout:
                 logger.warning(f"❌ Timeout reached for {symbol}.")
+                status = FETCH_TIMEOUT
                 break
 
             try:
                 res = ws.recv()
             except Exception as e:
                 logger.error(f"❌ WebSocket error for {symbol}: {e}")
+                status = classify_error(str(e))
                 break
 
             if not res or res.startswith('~m~0~m~') or 'ping' in res.lower():
@@ -648,6 +706,7 @@ def fetch_candle_data(symbol):
 
             if "error" in res.lower():
                 logger.error(f"❌ Server error for {symbol}: {res[:200]}")
+                status = classify_error(res)
                 break
 
             # Parse the message
@@ -685,7 +744,8 @@ def fetch_candle_data(symbol):
                                     "open": open_price,
                                     "high": high,
                                     "low": low,
-                                    "close": close
+                                    "close": close,
+                                    "volume": volume
                                 }
                                 candle_data.append(candle_formatted)
 
@@ -694,43 +754,136 @@ def fetch_candle_data(symbol):
                         logger.error(f"⚠️ Error parsing data for {symbol}: {e}")
 
                 elif message.get('m') == 'series_completed':
+                    # Short histories never reach `limit`, so stop here instead of waiting for the timeout
                     logger.info(f"✅ Series completed for {symbol}.")
+                    series_completed = True
                     break
 
-            if data_received and len(candle_data) >= limit:
-                logger.info(f"✅ Received all {limit} candles for {symbol}.")
+            if data_received and len(candle_data) >= bars:
+                logger.info(f"✅ Received all {bars} candles for {symbol}.")
                 break
 
         ws.close()
 
-        # Add to global dictionary
+        # Partial data after a timeout is still kept, as before
         if candle_data:
-            all_symbols_data[symbol] = candle_data
-            logger.info(f"✅ Added {symbol} to data store: {len(candle_data)} candles")
-            return True
-        else:
-            logger.warning(f"❌ No data collected for {symbol}")
-            return False
+            return FETCH_OK, candle_data
+        return status, []
 
     except Exception as e:
         logger.error(f"❌ Unexpected error fetching {symbol}: {e}")
-        return False
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        return classify_error(str(e)), []
 
 
-def save_all_data_to_json():
-    """Save all collected symbol data to a single JSON file"""
-    if all_symbols_data:
-        filename = "1_price_list.json"
+class CandleDataset:
+    """Candles collected by one fetch run
+
+    By default completed symbols are kept in memory. With spill_file set, each completed
+    symbol is written straight into that NumPy store instead, so memory only holds the
+    symbols still in flight. Call release() when the run is done.
+    """
+
+    def __init__(self, spill_file=None):
+        self.spill_file = spill_file
+        self.counts = {}  # symbol -> number of candles, in completion order
+        self._candles = {}
+        self._lock = threading.Lock()
+        self._writer = PriceStoreWriter(spill_file) if spill_file else None
+
+    def add(self, symbol, candle_data):
+        array = candles_to_array(candle_data) if self._writer else None
+        with self._lock:
+            self.counts[symbol] = len(candle_data)
+            if self._writer:
+                self._writer.add(symbol, array)
+            else:
+                self._candles[symbol] = candle_data
+
+    def finish(self):
+        """Close the spill store once fetching is over
+
+        A run that collected nothing (an outage) discards the new store, so the last good one stays.
+        """
+        if self._writer:
+            if self.counts:
+                self._writer.close()
+            else:
+                logger.warning(f"⚠️ No symbols fetched, keeping the existing {self.spill_file}")
+                self._writer.abort()
+            self._writer = None
+
+    def items(self):
+        """Yield (symbol, candles) one symbol at a time"""
+        if not self.counts:
+            return
+        if not self.spill_file:
+            yield from self._candles.items()
+            return
+
+        with np.load(self.spill_file) as data:
+            for symbol in self.counts:
+                yield symbol, array_to_candles(symbol, data[symbol], resolution)
+
+    def release(self):
+        if self._writer:
+            self._writer.abort()
+            self._writer = None
+        self._candles.clear()
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def fetch_symbol(symbol, dataset, limiter=None, bars=limit):
+    """Fetch one symbol into the dataset, pacing and reporting through the limiter"""
+    if limiter is not None:
+        limiter.acquire()
+
+    status, candle_data = download_candles(symbol, bars)
+
+    if limiter is not None:
+        if status in (FETCH_THROTTLED, FETCH_ERROR):
+            limiter.on_throttle()
+        elif status == FETCH_OK:
+            limiter.on_success()
+
+    if status == FETCH_OK:
+        dataset.add(symbol, candle_data)
+        logger.info(f"✅ Added {symbol} to data store: {len(candle_data)} candles")
+    else:
+        logger.warning(f"❌ No data collected for {symbol} ({status})")
+    return status
+
+
+def fetch_candle_data(symbol, dataset):
+    """Fetch candle data for a single symbol"""
+    return fetch_symbol(symbol, dataset) == FETCH_OK
+
+
+def save_all_data_to_json(dataset, filename="1_price_list.json"):
+    """Save all collected symbol data to a single JSON file, writing one symbol at a time"""
+    if len(dataset):
         try:
+            # Same layout as json.dump(..., indent=4) of the whole dict, without building it
             with open(filename, 'w') as f:
-                json.dump(all_symbols_data, f, indent=4)
+                f.write("{")
+                for n, (symbol, candles) in enumerate(dataset.items()):
+                    f.write("," if n else "")
+                    f.write(f"\n    {json.dumps(symbol)}: ")
+                    f.write(json.dumps(candles, indent=4).replace("\n", "\n    "))
+                f.write("\n}")
 
             logger.info(f"🎯 All data saved successfully to {filename}")
-            logger.info(f"📊 Total symbols: {len(all_symbols_data)}")
+            logger.info(f"📊 Total symbols: {len(dataset)}")
 
             # Log summary
-            for symbol, candles in all_symbols_data.items():
-                logger.info(f"   {symbol}: {len(candles)} candles")
+            for symbol, count in dataset.counts.items():
+                logger.info(f"   {symbol}: {count} candles")
 
             return True
 
@@ -742,23 +895,174 @@ def save_all_data_to_json():
         return False
 
 
-def fetch_all_candles():
-    """Fetch candles for all symbols and save to file"""
+def save_price_store(dataset, filename=NUMPY_FILE):
+    """Write the in-memory dataset to the NumPy store (spilled datasets already wrote it)"""
+    if dataset.spill_file or not len(dataset):
+        return
+    with PriceStoreWriter(filename) as writer:
+        for symbol, candles in dataset.items():
+            writer.add(symbol, candles_to_array(candles))
+    logger.info(f"🎯 Price store saved to {filename}")
+
+
+def fetch_symbols(symbols_to_fetch, dataset, limiter, workers=FETCH_WORKERS, progress=None, bars=limit):
+    """Fetch symbols with a worker pool; retryable failures go to the back of the queue"""
+    work = queue.Queue()
+    for symbol in symbols_to_fetch:
+        work.put((symbol, 1))
+
+    statuses = {}
+    finished = []
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            symbol, attempt = item
+            try:
+                status = worker_call(fetch_symbol, symbol, dataset, limiter, bars)
+                statuses[symbol] = status
+                if status in RETRYABLE_STATUSES and attempt < MAX_FETCH_ATTEMPTS:
+                    logger.info(f"🔁 Re-queueing {symbol} (attempt {attempt + 1}/{MAX_FETCH_ATTEMPTS})")
+                    work.put((symbol, attempt + 1))
+                else:
+                    finished.append(symbol)
+            except Exception as e:
+                logger.error(f"❌ Worker error for {symbol}: {e}")
+                statuses[symbol] = FETCH_ERROR
+                finished.append(symbol)
+            finally:
+                if progress is not None:
+                    progress(len(finished), len(symbols_to_fetch), "fetch")
+                work.task_done()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    work.join()
+
+    # One sentinel per worker ends the pool, so repeated runs don't accumulate idle threads
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def record_symbol_health(health, statuses, dataset):
+    """Feed final fetch outcomes into the symbol-health cache"""
+    for symbol, status in statuses.items():
+        if status == FETCH_OK:
+            update_symbol_health(health, symbol, None, dataset.counts.get(symbol, 0))
+        elif status == FETCH_RESOLVE_FAILED:
+            update_symbol_health(health, symbol, RESOLVE_FAILED)
+        elif status in (FETCH_EMPTY, FETCH_TIMEOUT):
+            update_symbol_health(health, symbol, EMPTY)
+
+
+def fetch_dataset(spill_file=None, progress=None):
+    """Fetch candles for all symbols into a new CandleDataset"""
     logger.info("🚀 Starting candle data fetching for all symbols")
     logger.info(f"📊 Total symbols to fetch: {len(symbols)}")
 
-    successful_fetches = 0
-    for symbol in symbols:
-        if fetch_candle_data(symbol):
-            successful_fetches += 1
-        time.sleep(2)  # Rate limiting
+    # Skip known-dead symbols until their TTL expires, fetch re-probes and short histories last
+    health = load_symbol_health()
+    to_fetch, skipped = plan_fetch(symbols, health)
+    if skipped:
+        logger.info(f"🩺 Skipping {len(skipped)} known-bad symbols: {', '.join(skipped)}")
+
+    dataset = CandleDataset(spill_file)
+    try:
+        limiter = AdaptiveRateLimiter()
+        statuses = fetch_symbols(to_fetch, dataset, limiter, progress=progress)
+        dataset.finish()
+    except BaseException:
+        dataset.release()
+        raise
+    successful_fetches = sum(1 for status in statuses.values() if status == FETCH_OK)
+
+    # A run with no successes is an outage, not evidence that every symbol is dead
+    if successful_fetches:
+        record_symbol_health(health, statuses, dataset)
+        save_symbol_health(health)
+
+    logger.info(f"🎯 Fetching completed: {successful_fetches}/{len(to_fetch)} symbols successful, "
+                f"{len(skipped)} skipped")
+    logger.info(f"📈 Request rate: {limiter.summary()}")
+    return dataset
 
-    # Save all data to single file
-    success = save_all_data_to_json()
 
-    logger.info(f"🎯 Fetching completed: {successful_fetches}/{len(symbols)} symbols successful")
+@profiled("fetch_all_candles")
+def fetch_all_candles(spill=SPILL_TO_STORE, progress=None):
+    """Fetch candles for all symbols and save to file"""
+    dataset = fetch_dataset(NUMPY_FILE if spill else None, progress)
+    try:
+        # Save all data to single file
+        success = save_all_data_to_json(dataset)
+        save_price_store(dataset)
+    finally:
+        dataset.release()
     return success
 
 
+
+def merge_bars(stored, fresh, max_bars=limit):
+    """A symbol's store array with freshly fetched bars appended, trimmed to the newest max_bars
+
+    Fresh rows replace stored ones from their first start_at on, so a bar that was still
+    forming at the last fetch is overwritten with its final values.
+    """
+    kept = stored[stored[:, START_AT] < fresh[0, START_AT]]
+    return np.concatenate([kept, fresh])[-max_bars:]
+
+
+@profiled("refresh_candles")
+def refresh_candles(bars=REFRESH_BARS, filename=NUMPY_FILE, progress=None):
+    """Fetch only the latest bars of every stored symbol and append them to the price store
+
+    Much cheaper than fetch_all_candles(): a short series request per symbol, no JSON dump.
+    Symbols that are not in the store yet wait for the next full fetch; symbols whose refresh
+    fails keep their stored bars. Without a store, falls back to the full fetch.
+    """
+    if not os.path.exists(filename):
+        logger.info(f"📭 No price store at {filename}, running a full fetch instead")
+        return fetch_all_candles(progress=progress)
+
+    # Arrays from old stores without a start_at column can't be merged; the full fetch replaces them
+    to_fetch = []
+    with np.load(filename) as data:
+        stored = data.files
+        for symbol in stored:
+            if data[symbol].shape[1] > START_AT:
+                to_fetch.append(symbol)
+    logger.info(f"🔁 Refreshing the last {bars} bars of {len(to_fetch)} stored symbols")
+
+    dataset = CandleDataset()
+    try:
+        limiter = AdaptiveRateLimiter()
+        statuses = fetch_symbols(to_fetch, dataset, limiter, progress=progress, bars=bars)
+        fresh = dict(dataset.items())
+    finally:
+        dataset.release()
+
+    # Same outage rule as the full fetch: nothing fetched leaves the store as it was
+    if not fresh:
+        logger.error("❌ Refresh fetched no symbols, price store unchanged")
+        return False
+
+    with np.load(filename) as data, PriceStoreWriter(filename) as writer:
+        for symbol in stored:
+            array = data[symbol]
+            if symbol in fresh:
+                array = merge_bars(array, candles_to_array(fresh[symbol]))
+            writer.add(symbol, array)
+
+    failed = sum(1 for status in statuses.values() if status != FETCH_OK)
+    logger.info(f"🎯 Refresh updated {len(fresh)}/{len(to_fetch)} symbols ({failed} failed) in {filename}")
+    logger.info(f"📈 Request rate: {limiter.summary()}")
+    return True
+
+
 if __name__ == "__main__":
     fetch_all_candles()
\ No newline at end of file
@@ -0,0 +1,206 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.adfvalues import mackinnonp, mackinnoncrit
+
+from calculate_cointegration import (RESULTS_FILE, load_price_arrays, pair_window, eg_ols_terms, eg_adf_row,
+                                     eg_moments, eg_t_from_moments)
+from price_cleaning import BAR_SECONDS, clean_close_panel
+
+# Trailing bars each tracked pair is tested on; pairs whose valid window is shorter are skipped
+INCREMENTAL_WINDOW_BARS = int(os.environ.get("INCREMENTAL_WINDOW_BARS", 1000))
+
+INCREMENTAL_STATE_FILE = "incremental_coint_state.npz"
+INCREMENTAL_RESULTS_FILE = "2_cointegrated_pairs_incremental.csv"
+
+class SlidingEngleGranger:
+    """Engle-Granger statistics for many pairs over a sliding window, updated one bar at a time
+
+    Keeps the cross-product sums of the hedge-ratio regression ([1, y, x]) and of the one-lag
+    residual ADF regression, written in terms of y and x so they stay valid when the hedge
+    ratio moves. push() adds the newest bar and drops the oldest in O(pairs); the statistics
+    are the same as batch_engle_granger() on the current window. Sums are recomputed from the
+    window every window_bars pushes, to keep rounding drift bounded.
+    """
+
+    def __init__(self, Y, X):
+        self.window_bars, self.n_pairs = Y.shape
+        self._y = np.array(Y, dtype=np.float64)
+        self._x = np.array(X, dtype=np.float64)
+        self._head = 0  # ring buffer index of the oldest bar
+        self.y_ref = np.zeros(self.n_pairs)
+        self.x_ref = np.zeros(self.n_pairs)
+        self.rebuild()
+
+    def rebuild(self):
+        """Recompute all sums exactly from the window, re-centred on its current means"""
+        y, x = self.window()
+        self.y_ref = y.mean(axis=0)
+        self.x_ref = x.mean(axis=0)
+        self._y, self._x = y - self.y_ref, x - self.x_ref
+        self._head = 0
+        self._pushes = 0
+
+        self._ols_sums, self._adf_sums = eg_moments(self._y, self._x)
+
+    def window(self):
+        """(window_bars, n_pairs) y and x in bar order, in original units"""
+        order = (self._head + np.arange(self.window_bars)) % self.window_bars
+        return self._y[order] + self.y_ref, self._x[order] + self.x_ref
+
+    def _bar(self, age):
+        """Centred (y, x) of the bar age steps after the oldest"""
+        k = (self._head + age) % self.window_bars
+        return self._y[k], self._x[k]
+
+    def push(self, y, x):
+        """Slide the window one bar forward; NaN prices carry the pair's last value"""
+        newest_y, newest_x = self._bar(-1)
+        y = np.where(np.isnan(y), newest_y, np.asarray(y, dtype=np.float64) - self.y_ref)
+        x = np.where(np.isnan(x), newest_x, np.asarray(x, dtype=np.float64) - self.x_ref)
+        ones = np.ones(self.n_pairs)
+
+        # Drop the oldest bar from the OLS sums and the ADF row that lags it by two
+        (y0, x0), (y1, x1), (y2, x2) = self._bar(0), self._bar(1), self._bar(2)
+        old_ols = eg_ols_terms(ones, y0, x0)
+        old_adf = eg_adf_row(y0, x0, y1, x1, y2, x2)
+
+        # Add the new bar and the ADF row ending at it
+        previous_y, previous_x = self._bar(-2)
+        new_ols = eg_ols_terms(ones, y, x)
+        new_adf = eg_adf_row(previous_y, previous_x, newest_y, newest_x, y, x)
+
+        self._ols_sums += outer(new_ols) - outer(old_ols)
+        self._adf_sums += outer(new_adf) - outer(old_adf)
+        self._y[self._head], self._x[self._head] = y, x
+        self._head = (self._head + 1) % self.window_bars
+
+        self._pushes += 1
+        if self._pushes >= self.window_bars:
+            self.rebuild()
+
+    def statistics(self):
+        """(t_stats, hedge_ratios) of every pair on the current window"""
+        return eg_t_from_moments(self._ols_sums, self._adf_sums, self.window_bars - 2)
+
+    def results(self):
+        """Per-pair dict columns in the results CSV's terms (MacKinnon p-value and 5% critical value)"""
+        t_stats, hedge_ratios = self.statistics()
+        c_value = mackinnoncrit(N=2, regression="c", nobs=self.window_bars - 1)[1]
+        p_values = np.array([mackinnonp(t, regression="c", N=2) if np.isfinite(t) else 1.0 for t in t_stats])
+        return {
+            "p_value": p_values,
+            "t_value": t_stats,
+            "c_value": np.full(self.n_pairs, c_value),
+            "hedge_ratio": hedge_ratios,
+            "coint_flag": ((p_values < 0.05) & (t_stats < c_value)).astype(int),
+        }
+
+    def state(self):
+        """Everything needed to continue exactly where this tracker is (see from_state)"""
+        return {"y": self._y, "x": self._x, "y_ref": self.y_ref, "x_ref": self.x_ref,
+                "ols_sums": self._ols_sums, "adf_sums": self._adf_sums,
+                "head": self._head, "pushes": self._pushes}
+
+    @classmethod
+    def from_state(cls, state):
+        """Restore a tracker saved by state() without recomputing its sums, so resuming stays O(pairs)"""
+        tracker = cls.__new__(cls)
+        tracker._y, tracker._x = np.array(state["y"]), np.array(state["x"])
+        tracker.window_bars, tracker.n_pairs = tracker._y.shape
+        tracker.y_ref, tracker.x_ref = np.array(state["y_ref"]), np.array(state["x_ref"])
+        tracker._ols_sums, tracker._adf_sums = np.array(state["ols_sums"]), np.array(state["adf_sums"])
+        tracker._head, tracker._pushes = int(state["head"]), int(state["pushes"])
+        return tracker
+
+
+def outer(rows):
+    return rows[:, :, None] * rows[:, None, :]
+
+
+def tracked_pairs(df_coint, symbols, segments, n_bars, window_bars):
+    """(sym_1, sym_2, i, j) for result pairs whose valid window covers the trailing window_bars"""
+    column_of = {symbol: k for k, symbol in enumerate(symbols)}
+    pairs = []
+    for sym_1, sym_2 in zip(df_coint["sym_1"], df_coint["sym_2"]):
+        if sym_1 not in column_of or sym_2 not in column_of:
+            continue
+        i, j = column_of[sym_1], column_of[sym_2]
+        lo, hi = pair_window(None, segments, i, j)
+        if hi == n_bars and hi - lo >= window_bars:
+            pairs.append((sym_1, sym_2, i, j))
+    return pairs
+
+
+def save_state(tracker, pairs, last_bar, state_file=INCREMENTAL_STATE_FILE):
+    tmp_file = f"{state_file}.tmp.npz"
+    np.savez(tmp_file, **tracker.state(), last_bar=last_bar,
+             pairs=json.dumps([[sym_1, sym_2] for sym_1, sym_2, _, _ in pairs]))
+    os.replace(tmp_file, state_file)
+
+
+def load_state(state_file=INCREMENTAL_STATE_FILE):
+    """(tracker, pair names, last_bar) from a saved state, or None"""
+    try:
+        with np.load(state_file) as state:
+            tracker = SlidingEngleGranger.from_state(state)
+            return tracker, [tuple(pair) for pair in json.loads(str(state["pairs"]))], int(state["last_bar"])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def update_incremental(results_file=RESULTS_FILE, state_file=INCREMENTAL_STATE_FILE,
+                       output_file=INCREMENTAL_RESULTS_FILE, window_bars=INCREMENTAL_WINDOW_BARS):
+    """Bring the flagged pairs' statistics up to the newest bar and write them to output_file
+
+    Continues from the saved state when it tracks the same pairs, pushing only bars newer
+    than the last one seen; otherwise (or after a gap longer than the window) it starts over
+    from the trailing window of the current prices.
+    """
+    symbols, start_ats, closes, _ = load_price_arrays()
+    if symbols is None or not os.path.exists(results_file):
+        return False
+
+    panel, segments, stats = clean_close_panel(start_ats, closes)
+    n_bars = panel.shape[0]
+    window_bars = min(window_bars, n_bars)
+    newest_bar = stats["grid_start"] + (n_bars - 1) * BAR_SECONDS
+
+    pairs = tracked_pairs(pd.read_csv(results_file), symbols, segments, n_bars, window_bars)
+    if not pairs:
+        print("⚠️ No flagged pairs cover the incremental window")
+        return False
+    i_cols = np.array([i for _, _, i, _ in pairs])
+    j_cols = np.array([j for _, _, _, j in pairs])
+
+    saved = load_state(state_file)
+    new_bars = 0
+    if saved is not None:
+        tracker, saved_pairs, last_bar = saved
+        new_bars = (newest_bar - last_bar) // BAR_SECONDS
+        resumable = (saved_pairs == [(sym_1, sym_2) for sym_1, sym_2, _, _ in pairs]
+                     and tracker.window_bars == window_bars and 0 <= new_bars < window_bars)
+        if not resumable:
+            saved = None
+
+    if saved is None:
+        rows = slice(n_bars - window_bars, n_bars)
+        tracker = SlidingEngleGranger(panel[rows, i_cols], panel[rows, j_cols])
+        print(f"🧮 Incremental tracker started for {len(pairs)} pairs on {window_bars} bars")
+    else:
+        for row in range(n_bars - new_bars, n_bars):
+            tracker.push(panel[row, i_cols], panel[row, j_cols])
+        print(f"🧮 Incremental tracker advanced {new_bars} bars for {len(pairs)} pairs")
+
+    save_state(tracker, pairs, newest_bar, state_file)
+    results = tracker.results()
+    df = pd.DataFrame({"sym_1": [pair[0] for pair in pairs], "sym_2": [pair[1] for pair in pairs], **results})
+    df.to_csv(output_file, index=False)
+    print(f"✅ Incremental statistics for {len(df)} pairs saved to {output_file} "
+          f"({int(results['coint_flag'].sum())} still cointegrated)")
+    return True
+
+
+if __name__ == "__main__":
+    update_incremental()
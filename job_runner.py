@@ -0,0 +1,158 @@
+import fcntl
+import itertools
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs kept for GET /jobs/<id>
+MAX_FINISHED_JOBS = 100
+
+
+class FileLock:
+    """Exclusive lock held through a lock file (flock), so it also excludes other processes
+
+    Usable as JobRunner's shared lock; a thread lock in front keeps threads of one process in line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+
+class JobRunner:
+    """Bounded background pool for pipeline jobs, with progress tracking
+
+    Submitting a kind of job that is already queued or running returns the existing job
+    instead of starting a second one. With a shared lock, jobs of any kind (and anything else
+    holding the lock) run one at a time; they stay queued until they get it. Job functions
+    receive a progress(done, total, stage=None) callback.
+    """
+
+    def __init__(self, max_workers=1, lock=None):
+        self.exclusive_lock = lock
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._active = {}  # kind -> job id
+
+    def submit(self, kind, func):
+        """Enqueue func under kind; returns (job, merged)"""
+        with self._lock:
+            active_id = self._active.get(kind)
+            if active_id is not None:
+                return self._snapshot(self._jobs[active_id]), True
+
+            job = {
+                "id": str(next(self._ids)),
+                "kind": kind,
+                "status": QUEUED,
+                "stage": None,
+                "done": 0,
+                "total": None,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "started_stage_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            self._active[kind] = job["id"]
+            self._prune()
+            snapshot = self._snapshot(job)
+
+        self._pool.submit(self._run, job, func)
+        logger.info(f"📥 Queued {kind} job {job['id']}")
+        return snapshot, False
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def wait(self, job_id, poll_seconds=5):
+        """Block until the job has finished; returns its final snapshot"""
+        while True:
+            job = self.get(job_id)
+            if job is None or job["finished_at"] is not None:
+                return job
+            time.sleep(poll_seconds)
+
+    def _run(self, job, func):
+        if self.exclusive_lock is None:
+            self._run_job(job, func)
+        else:
+            with self.exclusive_lock:
+                self._run_job(job, func)
+
+    def _run_job(self, job, func):
+        with self._lock:
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+
+        def progress(done, total, stage=None):
+            with self._lock:
+                if stage is not None and stage != job["stage"]:
+                    job["stage"] = stage
+                    job["started_stage_at"] = time.time()
+                job["done"] = done
+                job["total"] = total
+
+        try:
+            result = func(progress)
+            status, error = (DONE if result else FAILED), None
+        except Exception as e:
+            logger.error(f"❌ {job['kind']} job {job['id']} crashed: {e}")
+            result, status, error = None, FAILED, str(e)
+
+        with self._lock:
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = time.time()
+            self._active.pop(job["kind"], None)
+        logger.info(f"🏁 {job['kind']} job {job['id']} {status}")
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _snapshot(self, job):
+        snapshot = dict(job)
+        snapshot["eta_seconds"] = None
+        stage_started = job["started_stage_at"] or job["started_at"]
+        if job["status"] == RUNNING and job["total"] and job["done"]:
+            elapsed = time.time() - stage_started
+            snapshot["eta_seconds"] = round(elapsed / job["done"] * (job["total"] - job["done"]), 1)
+        snapshot.pop("started_stage_at", None)
+        return snapshot
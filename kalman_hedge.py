@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+from calculate_cointegration import RESULTS_FILE, load_clean_series
+
+# State noise as a fraction of the state (Chan's delta); smaller means slower-moving hedge ratios
+KALMAN_DELTA = 1e-4
+
+
+class KalmanHedgeFilter:
+    """Kalman filter for y_t = hedge_t * x_t + intercept_t, vectorized across pairs
+
+    State is (hedge, intercept) per pair with a (n_pairs, 2, 2) covariance, so advancing
+    every pair by one bar is a handful of array operations. NaN observations only widen the
+    covariance, which lets series of different lengths share one panel.
+    """
+
+    def __init__(self, n_pairs, delta=KALMAN_DELTA, obs_var=1.0, initial_hedge=None):
+        self.hedge = np.zeros(n_pairs) if initial_hedge is None else np.array(initial_hedge, dtype=np.float64)
+        self.intercept = np.zeros(n_pairs)
+        self.cov = np.tile(np.eye(2), (n_pairs, 1, 1))
+        self.state_var = delta / (1 - delta)
+        self.obs_var = np.broadcast_to(np.asarray(obs_var, dtype=np.float64), (n_pairs,)).copy()
+
+    def update(self, y, x):
+        """Advance every pair by one bar; returns (hedge ratios, spreads) for that bar
+
+        The spread uses the hedge ratio predicted before seeing the bar, y - hedge * x, in the
+        same form as calculate_spread(), so it carries no look-ahead.
+        """
+        y = np.asarray(y, dtype=np.float64)
+        x = np.asarray(x, dtype=np.float64)
+        valid = ~(np.isnan(y) | np.isnan(x))
+        y = np.where(valid, y, 0.0)
+        x = np.where(valid, x, 0.0)
+
+        # Predict
+        self.cov[:, 0, 0] += self.state_var
+        self.cov[:, 1, 1] += self.state_var
+        hedge_prior = self.hedge.copy()
+        spread = np.where(valid, y - hedge_prior * x, np.nan)
+        error = y - (hedge_prior * x + self.intercept)
+
+        # Update with H = [x, 1]
+        p00, p01, p10, p11 = self.cov[:, 0, 0], self.cov[:, 0, 1], self.cov[:, 1, 0], self.cov[:, 1, 1]
+        hp0 = x * p00 + p10
+        hp1 = x * p01 + p11
+        innovation_var = x * hp0 + hp1 + self.obs_var
+        gain_0 = np.where(valid, (p00 * x + p01) / innovation_var, 0.0)
+        gain_1 = np.where(valid, (p10 * x + p11) / innovation_var, 0.0)
+
+        self.hedge = self.hedge + gain_0 * error
+        self.intercept = self.intercept + gain_1 * error
+        self.cov = self.cov - np.stack([
+            np.stack([gain_0 * hp0, gain_0 * hp1], axis=-1),
+            np.stack([gain_1 * hp0, gain_1 * hp1], axis=-1),
+        ], axis=1)
+
+        return self.hedge.copy(), spread
+
+
+def default_obs_var(Y):
+    """Per-pair observation variance: the variance of bar-to-bar changes in y"""
+    obs_var = np.nanvar(np.diff(Y, axis=0), axis=0)
+    return np.where(np.isfinite(obs_var) & (obs_var > 0), obs_var, 1.0)
+
+
+def kalman_hedge_ratios(Y, X, delta=KALMAN_DELTA, obs_var=None, initial_hedge=None):
+    """Run the filter over (n_bars, n_pairs) panels; returns (hedge_ratios, spreads, kalman)
+
+    obs_var defaults to default_obs_var(Y), so the filter adapts to price scale. Each spreads
+    column can be passed straight to calculate_zscore(), and kalman is left at the last bar,
+    ready for kalman.update() as new bars arrive.
+    """
+    if obs_var is None:
+        obs_var = default_obs_var(Y)
+
+    kalman = KalmanHedgeFilter(Y.shape[1], delta, obs_var, initial_hedge)
+    hedge_ratios = np.empty_like(Y, dtype=np.float64)
+    spreads = np.empty_like(Y, dtype=np.float64)
+    for t in range(Y.shape[0]):
+        hedge_ratios[t], spreads[t] = kalman.update(Y[t], X[t])
+    return hedge_ratios, spreads, kalman
+
+
+def pair_panels(pairs, series_by_symbol, segments_by_symbol=None):
+    """Build NaN-padded (n_bars, n_pairs) panels of sym_1 and sym_2 closes
+
+    Each pair covers the bars the scan tested it on: with segments (from clean_series), the
+    overlap of both symbols' valid runs, as in pair_window(), and NaN elsewhere; without, its
+    first min(len_1, len_2) bars.
+    """
+    windows = []
+    for sym_1, sym_2 in pairs:
+        if segments_by_symbol is None:
+            windows.append((0, min(len(series_by_symbol[sym_1]), len(series_by_symbol[sym_2]))))
+        else:
+            segment_1, segment_2 = segments_by_symbol[sym_1], segments_by_symbol[sym_2]
+            windows.append((max(segment_1[0], segment_2[0]), min(segment_1[1], segment_2[1])))
+
+    Y = np.full((max((hi for _, hi in windows), default=0), len(pairs)), np.nan)
+    X = np.full_like(Y, np.nan)
+    for k, ((sym_1, sym_2), (lo, hi)) in enumerate(zip(pairs, windows)):
+        Y[lo:hi, k] = np.asarray(series_by_symbol[sym_1], dtype=np.float64)[lo:hi]
+        X[lo:hi, k] = np.asarray(series_by_symbol[sym_2], dtype=np.float64)[lo:hi]
+    return Y, X
+
+
+def kalman_hedge_for_results(results_file=RESULTS_FILE, delta=KALMAN_DELTA):
+    """Dynamic hedge ratios for every flagged pair in the results CSV, seeded with the OLS ones
+
+    Returns (pairs, hedge_ratios, spreads, kalman).
+    """
+    df_coint = pd.read_csv(results_file)
+    symbols, series, segments = load_clean_series()
+    if symbols is None or df_coint.empty:
+        return [], None, None, None
+
+    series_by_symbol = dict(zip(symbols, series))
+    pairs = list(zip(df_coint["sym_1"], df_coint["sym_2"]))
+    Y, X = pair_panels(pairs, series_by_symbol, dict(zip(symbols, segments)))
+    hedge_ratios, spreads, kalman = kalman_hedge_ratios(Y, X, delta,
+                                                        initial_hedge=df_coint["hedge_ratio"].values)
+
+    print(f"✅ Kalman hedge ratios for {len(pairs)} pairs over {Y.shape[0]} bars")
+    return pairs, hedge_ratios, spreads, kalman
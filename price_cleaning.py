@@ -0,0 +1,108 @@
+import os
+import numpy as np
+
+# Hourly bars (fetch_candles.resolution = "60")
+BAR_SECONDS = 3600
+
+# How short gaps are filled: "ffill" (carry the last close), "interpolate" (linear) or "none".
+# Set through the environment so the scan and every post-scan stage clean the same way
+GAP_FILL_POLICIES = ("ffill", "interpolate", "none")
+GAP_FILL_POLICY = os.environ.get("GAP_FILL_POLICY", "ffill").lower()
+MAX_FILL_BARS = int(os.environ.get("MAX_FILL_BARS", 3))
+
+# The aligned panel covers at most this many bars back from the newest candle
+MAX_PANEL_BARS = 5000
+
+
+def align_close_panel(start_ats, closes, max_bars=MAX_PANEL_BARS):
+    """Place every symbol's closes on one hourly grid
+
+    Returns an (n_bars, n_symbols) float64 panel where missing hours and NaN closes are NaN.
+    The grid ends at the newest candle across all symbols.
+    """
+    newest = max((int(np.max(times)) for times in start_ats if len(times)), default=0)
+    oldest = min((int(np.min(times)) for times in start_ats if len(times)), default=newest)
+    n_bars = min(max_bars, (newest - oldest) // BAR_SECONDS + 1)
+    grid_start = newest - (n_bars - 1) * BAR_SECONDS
+
+    panel = np.full((n_bars, len(closes)), np.nan)
+    for k, (times, values) in enumerate(zip(start_ats, closes)):
+        rows = (np.asarray(times, dtype=np.int64) - grid_start) // BAR_SECONDS
+        inside = (rows >= 0) & (rows < n_bars)
+        panel[rows[inside], k] = np.asarray(values, dtype=np.float64)[inside]
+    return panel, grid_start
+
+
+def gap_bounds(valid):
+    """For every row, the index of the previous and next valid row in its column (-1 / n if none)"""
+    n_bars = valid.shape[0]
+    rows = np.arange(n_bars)[:, None]
+    previous = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, rows, n_bars)[::-1], axis=0)[::-1]
+    return previous, following
+
+
+def fill_short_gaps(panel, policy=GAP_FILL_POLICY, max_fill=MAX_FILL_BARS):
+    """Fill interior gaps of at most max_fill bars; longer gaps and the ends stay NaN
+
+    Returns (filled panel, number of filled cells).
+    """
+    if policy not in GAP_FILL_POLICIES:
+        raise ValueError(f"Unknown gap fill policy: {policy} (use {', '.join(GAP_FILL_POLICIES)})")
+    valid = np.isfinite(panel)
+    if policy == "none" or valid.all():
+        return panel, 0
+
+    n_bars = panel.shape[0]
+    previous, following = gap_bounds(valid)
+    fillable = ~valid & (previous >= 0) & (following < n_bars) & (following - previous - 1 <= max_fill)
+
+    columns = np.broadcast_to(np.arange(panel.shape[1]), panel.shape)
+    before = panel[np.clip(previous, 0, n_bars - 1), columns]
+    if policy == "ffill":
+        values = before
+    else:
+        after = panel[np.clip(following, 0, n_bars - 1), columns]
+        rows = np.arange(n_bars)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = (rows - previous) / (following - previous)
+        values = before + (after - before) * weight
+
+    filled = panel.copy()
+    filled[fillable] = values[fillable]
+    return filled, int(fillable.sum())
+
+
+def longest_valid_segments(panel):
+    """Half-open [start, stop) row range of each column's longest run of valid bars
+
+    Ties go to the most recent run; columns with no valid bars get (0, 0).
+    """
+    valid = np.isfinite(panel)
+    n_bars = panel.shape[0]
+    if n_bars == 0:
+        return np.zeros((panel.shape[1], 2), dtype=np.int64)
+
+    rows = np.arange(n_bars)[:, None]
+    last_invalid = np.maximum.accumulate(np.where(valid, -1, rows), axis=0)
+    run_lengths = np.where(valid, rows - last_invalid, 0)
+
+    stops = n_bars - np.argmax(run_lengths[::-1], axis=0)
+    lengths = run_lengths.max(axis=0)
+    return np.stack([np.where(lengths > 0, stops - lengths, 0), np.where(lengths > 0, stops, 0)], axis=1)
+
+
+def clean_close_panel(start_ats, closes, policy=GAP_FILL_POLICY, max_fill=MAX_FILL_BARS):
+    """Align, gap-fill and segment closes in one pass; returns (panel, segments, stats)"""
+    panel, grid_start = align_close_panel(start_ats, closes)
+    missing = int((~np.isfinite(panel)).sum())
+    panel, filled = fill_short_gaps(panel, policy, max_fill)
+    segments = longest_valid_segments(panel)
+    stats = {
+        "bars": panel.shape[0],
+        "grid_start": grid_start,
+        "missing": missing,
+        "filled": filled,
+        "outside_segments": int(panel.size - (segments[:, 1] - segments[:, 0]).sum()),
+    }
+    return panel, segments, stats
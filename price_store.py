@@ -0,0 +1,155 @@
+import os
+import json
+import argparse
+import zipfile
+import numpy as np
+
+# Binary price store read by calculate_cointegration.load_numpy_data()
+NUMPY_FILE = "1_price_list_numpy.npz"
+
+# Legacy dump: {"SYMBOL": [{candle}, ...], ...}, read back JSON_CHUNK_CHARS at a time
+LEGACY_JSON_FILE = "1_price_list.json"
+JSON_CHUNK_CHARS = 1 << 20
+
+# One (n_candles, len(COLUMNS)) float64 array per symbol; close stays in column 3
+COLUMNS = ("open", "high", "low", "close", "start_at", "volume")
+CLOSE = COLUMNS.index("close")
+START_AT = COLUMNS.index("start_at")
+VOLUME = COLUMNS.index("volume")
+
+
+def candles_to_array(candles):
+    """Convert a list of candle dicts into a store array"""
+    rows = [[candle.get(column) for column in COLUMNS] for candle in candles]
+    return np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+
+
+def array_to_candles(symbol, array, period="60"):
+    """Convert a store array back into candle dicts in the 1_price_list.json format"""
+    candles = []
+    for row in array:
+        candle = {"symbol": symbol, "period": period, "start_at": int(row[START_AT])}
+        for column, value in zip(COLUMNS, row):
+            if column == "start_at" or (column == "volume" and np.isnan(value)):
+                continue
+            candle[column] = float(value)
+        candles.append(candle)
+    return candles
+
+
+class PriceStoreWriter:
+    """Write symbol arrays into an .npz store one at a time, so only one symbol is in memory
+
+    The store is built under a temporary name and moved into place by close(), so readers
+    never see a half-written file.
+    """
+
+    def __init__(self, filename=NUMPY_FILE):
+        self.filename = filename
+        self._tmp_file = f"{filename}.partial"
+        self._zip = zipfile.ZipFile(self._tmp_file, "w", allowZip64=True)
+        self.symbols = []
+
+    def add(self, symbol, array):
+        with self._zip.open(f"{symbol}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asarray(array), allow_pickle=False)
+        self.symbols.append(symbol)
+
+    def close(self):
+        self._zip.close()
+        os.replace(self._tmp_file, self.filename)
+
+    def abort(self):
+        self._zip.close()
+        os.remove(self._tmp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class _JsonStream:
+    """Just enough of an incremental JSON reader to walk the legacy dump's top-level object"""
+
+    def __init__(self, f, chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+
+    def _more(self):
+        data = self._f.read(self._chunk_size)
+        if not data:
+            raise ValueError("Unexpected end of JSON price dump")
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            self._more()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON price dump, found {self._buf[self._pos]!r}")
+        self._pos += 1
+
+    def value(self, closing):
+        """Decode the string or array starting here, buffering until it is complete
+
+        Candle lists hold flat objects, so a value is never complete before the next closing
+        character is buffered; only then is decoding attempted.
+        """
+        self.peek()
+        while True:
+            if self._buf.find(closing, self._pos + 1) >= 0:
+                try:
+                    value, self._pos = self._decoder.raw_decode(self._buf, self._pos)
+                    return value
+                except json.JSONDecodeError:
+                    pass
+            self._more()
+
+
+def iter_legacy_json(filename=LEGACY_JSON_FILE, chunk_size=JSON_CHUNK_CHARS):
+    """Yield (symbol, store array) from a 1_price_list.json dump, one symbol at a time
+
+    Only the current symbol's candles are ever parsed into objects, so memory stays bounded by
+    the largest symbol rather than the whole file.
+    """
+    with open(filename, "r") as f:
+        stream = _JsonStream(f, chunk_size)
+        stream.expect("{")
+        while stream.peek() != "}":
+            symbol = stream.value('"')
+            stream.expect(":")
+            yield symbol, candles_to_array(stream.value("]"))
+            if stream.peek() == ",":
+                stream.expect(",")
+
+
+def convert_legacy_json(json_file=LEGACY_JSON_FILE, numpy_file=NUMPY_FILE):
+    """Stream a legacy JSON dump into the binary store; returns the number of symbols written"""
+    with PriceStoreWriter(numpy_file) as writer:
+        for symbol, array in iter_legacy_json(json_file):
+            writer.add(symbol, array)
+    print(f"✅ Converted {len(writer.symbols)} symbols from {json_file} to {numpy_file}")
+    return len(writer.symbols)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a legacy JSON price dump into the binary store")
+    parser.add_argument("json_file", nargs="?", default=LEGACY_JSON_FILE)
+    parser.add_argument("numpy_file", nargs="?", default=NUMPY_FILE)
+    args = parser.parse_args()
+    convert_legacy_json(args.json_file, args.numpy_file)
@@ -0,0 +1,183 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# PIPELINE_PROFILE=1 (or "all") profiles CPU and memory, "cpu" or "mem" just one of them
+PROFILE_ENV = "PIPELINE_PROFILE"
+PROFILE_DIR = "profiles"
+
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+
+_mode = os.environ.get(PROFILE_ENV, "").lower()
+_run_dir = None
+_run_label = None
+_active = None  # the stage being profiled, if any
+_lock = threading.Lock()
+
+
+def enable(mode="all"):
+    """Turn profiling on for this process (what --profile does)"""
+    global _mode
+    _mode = mode
+    os.environ[PROFILE_ENV] = mode  # inherited by shard worker processes
+
+
+def enabled():
+    return _mode not in ("", "0", "off", "false")
+
+
+def run_dir():
+    """The current run's timestamped output directory, created on first use
+
+    A run is the whole process unless profiled_run() starts a new one (once per job in the app).
+    """
+    global _run_dir
+    if _run_dir is None:
+        name = "-".join(str(part) for part in (datetime.now().strftime('%Y%m%d-%H%M%S'), _run_label, os.getpid())
+                        if part is not None)
+        _run_dir = os.path.join(PROFILE_DIR, name)
+        os.makedirs(_run_dir, exist_ok=True)
+    return _run_dir
+
+
+def profiled_run(label):
+    """Decorator: stages profiled during each call go to a new run directory named after label"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _run_dir, _run_label
+            if not enabled():
+                return func(*args, **kwargs)
+            with _lock:
+                _run_dir, _run_label = None, label
+            try:
+                return func(*args, **kwargs)
+            finally:
+                # Stages profiled outside any job start a directory of their own
+                with _lock:
+                    _run_dir, _run_label = None, None
+        return wrapper
+    return decorator
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.cpu = _mode != "mem"
+        self.memory = _mode != "cpu" and not tracemalloc.is_tracing()
+        self.profile = cProfile.Profile() if self.cpu else None
+        self.thread_profiles = []
+
+
+def profiled(stage):
+    """Decorator: profile each call of a pipeline stage when profiling is enabled
+
+    Off, the wrapper only checks a flag. Stages nested inside a profiled stage are covered by
+    the outer one and run as is.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _active
+            if not enabled() or _active is not None:
+                return func(*args, **kwargs)
+
+            with _lock:
+                if _active is not None:
+                    return func(*args, **kwargs)
+                _active = current = _Stage(stage)
+
+            started = time.perf_counter()
+            if current.memory:
+                tracemalloc.start()
+            if current.cpu:
+                current.profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if current.cpu:
+                    current.profile.disable()
+                snapshot, peak = None, None
+                if current.memory:
+                    snapshot = tracemalloc.take_snapshot()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                with _lock:
+                    _active = None
+                write_stage_report(current, time.perf_counter() - started, snapshot, peak)
+        return wrapper
+    return decorator
+
+
+def worker_call(func, *args, **kwargs):
+    """Call func from a worker thread, adding its profile to the running stage if there is one"""
+    stage = _active
+    if stage is None or not stage.cpu:
+        return func(*args, **kwargs)
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        with _lock:
+            stage.thread_profiles.append(profile)
+
+
+def stage_path(name, suffix):
+    """Next free <stage>[-n]<suffix> path in the run directory, so repeated calls keep every report"""
+    base = os.path.join(run_dir(), name)
+    path, n = f"{base}{suffix}", 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{base}-{n}{suffix}"
+    return path
+
+
+def write_stage_report(stage, seconds, snapshot, peak):
+    try:
+        report = stage_path(stage.name, ".txt")
+        out = io.StringIO()
+        out.write(f"Stage {stage.name}: {seconds:.2f}s wall\n\n")
+
+        if stage.cpu:
+            stats = pstats.Stats(stage.profile, stream=out)
+            for profile in stage.thread_profiles:
+                stats.add(profile)
+            if stage.thread_profiles:
+                out.write(f"Includes {len(stage.thread_profiles)} worker-thread calls\n")
+            stats.dump_stats(report[:-len(".txt")] + ".prof")
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            stats.sort_stats("tottime").print_stats(PROFILE_TOP_FUNCTIONS // 2)
+
+        if snapshot is not None:
+            out.write(f"Peak traced memory: {peak / 1e6:.1f} MB\n")
+            out.write(f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites still live at the end of the stage:\n")
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+                out.write(f"  {stat}\n")
+
+        with open(report, "w") as f:
+            f.write(out.getvalue())
+        logger.info(f"🔬 Profile of {stage.name} ({seconds:.1f}s) written to {report}")
+    except Exception as e:
+        logger.error(f"❌ Could not write profile for {stage.name}: {e}")
+
+
+def list_profiles(profile_dir=PROFILE_DIR):
+    """{run directory: [files]} for every profiled run, newest first"""
+    if not os.path.isdir(profile_dir):
+        return {}
+    runs = sorted(os.listdir(profile_dir), reverse=True)
+    return {run: sorted(os.listdir(os.path.join(profile_dir, run))) for run in runs
+            if os.path.isdir(os.path.join(profile_dir, run))}
@@ -0,0 +1,79 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by all fetch workers, with AIMD rate control
+
+    Every successful request nudges the rate up by `increase` req/s until `max_rate`, so the
+    fetcher ramps up to whatever the server tolerates. A throttling or server error halves
+    the rate and pauses all workers for an exponentially growing backoff.
+    """
+
+    def __init__(self, rate=0.5, min_rate=0.1, max_rate=10.0, burst=2, increase=0.05,
+                 base_backoff=2.0, max_backoff=120.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_failures = 0
+
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.throttles = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        """Back off after the server reported an error or throttled us"""
+        with self._lock:
+            self.throttles += 1
+            self._consecutive_failures += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_failures - 1))
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            self._tokens = 0.0
+        logger.warning(f"🐢 Throttled, backing off {backoff:.1f}s, rate now {self.rate:.2f} req/s")
+
+    def effective_rate(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.requests / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.requests} requests in {time.monotonic() - self.started_at:.0f}s, "
+                f"effective {self.effective_rate():.2f} req/s, final limit {self.rate:.2f} req/s, "
+                f"{self.throttles} throttles")
@@ -0,0 +1,182 @@
+import csv
+import gzip
+import heapq
+import json
+import math
+import os
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+RESULTS_FILE = "2_cointegrated_pairs.csv"
+
+# Compact artifacts mailed instead of the raw dumps; "zstd" needs the zstandard package
+COMPRESSION = os.environ.get("RESULTS_COMPRESSION", "gzip")
+SUMMARY_FILE = "2_results_summary.json"
+DELTA_FILE = "2_results_delta.jsonl"
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+# Pairs as of the last successful send, for the delta
+DELIVERY_STATE_FILE = "last_delivery_state.json.gz"
+
+TOP_PAIRS = int(os.environ.get("SUMMARY_TOP_PAIRS", 50))
+# A pair counts as changed when its p-value or hedge ratio moves by more than this (relative)
+DELTA_REL_TOL = 1e-3
+
+# Raw price dumps are always linked via /download, anything else above the size limit too
+LINK_ONLY_FILES = ("1_price_list.json", "1_price_list_numpy.npz")
+MAX_ATTACHMENT_BYTES = int(os.environ.get("MAX_ATTACHMENT_BYTES", 5 * 1024 * 1024))
+# Public address of the web process; without it links are bare /download paths
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "")
+
+
+def resolve_compression(compression=COMPRESSION):
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️ zstandard not installed, falling back to gzip")
+            return "gzip"
+    elif compression != "gzip":
+        raise ValueError(f"Unknown compression: {compression} (use gzip or zstd)")
+    return compression
+
+
+def open_compressed(path, compression, mode="wt"):
+    if compression == "zstd":
+        import zstandard
+        return zstandard.open(path, mode, encoding="utf-8")
+    return gzip.open(path, mode, encoding="utf-8")
+
+
+def iter_result_rows(results_file=RESULTS_FILE):
+    """Stream the results CSV one typed row at a time"""
+    with open(results_file, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            for column in ("p_value", "t_value", "c_value", "hedge_ratio"):
+                row[column] = float(row[column])
+            row["zero_crossings"] = int(float(row["zero_crossings"]))
+            yield row
+
+
+def pair_key(row):
+    return f"{row['sym_1']}|{row['sym_2']}"
+
+
+def build_summary(results_file=RESULTS_FILE, summary_file=SUMMARY_FILE, top_n=TOP_PAIRS, compression=COMPRESSION,
+                  run_info=None):
+    """Write the top pairs by p-value plus aggregate metrics in one pass; returns (path, summary)"""
+    compression = resolve_compression(compression)
+    top, symbols = [], set()
+    pairs = strong = zero_crossings = 0
+    p_value_sum, p_value_min = 0.0, math.inf
+
+    for n, row in enumerate(iter_result_rows(results_file)):
+        pairs += 1
+        symbols.update((row["sym_1"], row["sym_2"]))
+        p_value_sum += row["p_value"]
+        p_value_min = min(p_value_min, row["p_value"])
+        strong += row["p_value"] < 0.01
+        zero_crossings += row["zero_crossings"]
+        # Max-heap on p-value (ties keep the earlier row) holding the top_n smallest
+        entry = (-row["p_value"], -n, row)
+        if len(top) < top_n:
+            heapq.heappush(top, entry)
+        elif entry > top[0]:
+            heapq.heapreplace(top, entry)
+
+    summary = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "run": run_info,
+        "metrics": {
+            "pairs": pairs,
+            "symbols": len(symbols),
+            "pairs_p_below_0_01": strong,
+            "mean_p_value": p_value_sum / pairs if pairs else None,
+            "min_p_value": p_value_min if pairs else None,
+            "mean_zero_crossings": zero_crossings / pairs if pairs else None,
+        },
+        "top_pairs": [row for _, _, row in sorted(top, reverse=True)],
+    }
+
+    path = summary_file + EXTENSIONS[compression]
+    with open_compressed(path, compression) as f:
+        json.dump(summary, f, indent=2)
+    return path, summary
+
+
+def load_delivery_state(state_file=DELIVERY_STATE_FILE):
+    try:
+        with gzip.open(state_file, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+
+
+def save_delivery_state(state, state_file=DELIVERY_STATE_FILE):
+    tmp_file = f"{state_file}.tmp"
+    with gzip.open(tmp_file, "wt", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+
+def build_delta(results_file=RESULTS_FILE, delta_file=DELTA_FILE, state_file=DELIVERY_STATE_FILE,
+                compression=COMPRESSION):
+    """Write pairs added, changed or removed since the last send as compressed JSON lines
+
+    Returns (path, counts, state); path is None when there is no previous send to diff
+    against. state is what save_delivery_state() should record once the send succeeds.
+    """
+    compression = resolve_compression(compression)
+    previous = load_delivery_state(state_file)
+    state = {}
+    counts = {"added": 0, "changed": 0, "removed": 0}
+
+    if previous is None:
+        for row in iter_result_rows(results_file):
+            state[pair_key(row)] = [row["p_value"], row["hedge_ratio"]]
+        return None, counts, state
+
+    path = delta_file + EXTENSIONS[compression]
+    with open_compressed(path, compression) as f:
+        for row in iter_result_rows(results_file):
+            key = pair_key(row)
+            state[key] = [row["p_value"], row["hedge_ratio"]]
+            old = previous.pop(key, None)
+            if old is None:
+                change = "added"
+            elif not all(math.isclose(a, b, rel_tol=DELTA_REL_TOL) for a, b in zip(old, state[key])):
+                change = "changed"
+                row["previous_p_value"], row["previous_hedge_ratio"] = old
+            else:
+                continue
+            counts[change] += 1
+            f.write(json.dumps({"change": change, **row}) + "\n")
+
+        for key, (p_value, hedge_ratio) in previous.items():
+            sym_1, sym_2 = key.split("|", 1)
+            counts["removed"] += 1
+            f.write(json.dumps({"change": "removed", "sym_1": sym_1, "sym_2": sym_2,
+                                "previous_p_value": p_value, "previous_hedge_ratio": hedge_ratio}) + "\n")
+    return path, counts, state
+
+
+def download_link(path, base_url=PUBLIC_BASE_URL):
+    """Link to the file's /download route; just the path when no public base URL is configured"""
+    return f"{base_url.rstrip('/')}/download/{os.path.basename(path)}"
+
+
+def split_by_size(files, max_bytes=MAX_ATTACHMENT_BYTES, link_only=LINK_ONLY_FILES):
+    """(attachments, links) among the files that exist: small ones attached, large ones linked"""
+    attachments, links = [], []
+    if not PUBLIC_BASE_URL:
+        logger.warning("⚠️ PUBLIC_BASE_URL is not set, download links will be bare /download paths")
+    for path in files:
+        if not os.path.exists(path):
+            continue
+        if os.path.basename(path) not in link_only and os.path.getsize(path) <= max_bytes:
+            attachments.append(path)
+        else:
+            links.append(download_link(path))
+    return attachments, links
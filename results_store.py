@@ -0,0 +1,117 @@
+import sqlite3
+import time
+import logging
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# Append-only history of every scan run and the pairs it flagged
+HISTORY_DB = "cointegration_history.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_time INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    symbols INTEGER,
+    pairs_tested INTEGER,
+    pairs_found INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pair_results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    run_time INTEGER NOT NULL,
+    sym_1 TEXT NOT NULL,
+    sym_2 TEXT NOT NULL,
+    p_value REAL,
+    t_value REAL,
+    c_value REAL,
+    hedge_ratio REAL,
+    zero_crossings INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_pair_results_pair ON pair_results (sym_1, sym_2, run_time);
+CREATE INDEX IF NOT EXISTS idx_pair_results_run ON pair_results (run_id);
+CREATE INDEX IF NOT EXISTS idx_runs_time ON runs (run_time);
+"""
+
+PAIR_COLUMNS = ("sym_1", "sym_2", "p_value", "t_value", "c_value", "hedge_ratio", "zero_crossings")
+
+
+def connect(db_file=HISTORY_DB):
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_run(coint_pair_list, source, symbols=None, pairs_tested=None, run_time=None, db_file=HISTORY_DB):
+    """Append one run and all its pairs in a single transaction; returns the run id"""
+    run_time = int(time.time() if run_time is None else run_time)
+    with closing(connect(db_file)) as conn, conn:
+        run_id = conn.execute(
+            "INSERT INTO runs (run_time, source, symbols, pairs_tested, pairs_found) VALUES (?, ?, ?, ?, ?)",
+            (run_time, source, symbols, pairs_tested, len(coint_pair_list)),
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO pair_results (run_id, run_time, sym_1, sym_2, p_value, t_value, c_value, hedge_ratio, "
+            "zero_crossings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((run_id, run_time, *(pair[column] for column in PAIR_COLUMNS)) for pair in coint_pair_list),
+        )
+    logger.info(f"🗃️ Recorded run {run_id} ({source}) with {len(coint_pair_list)} pairs in {db_file}")
+    return run_id
+
+
+def recent_runs(limit=20, db_file=HISTORY_DB):
+    with closing(connect(db_file)) as conn:
+        rows = conn.execute("SELECT * FROM runs ORDER BY run_time DESC, run_id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+
+def pair_history(sym_1, sym_2, db_file=HISTORY_DB):
+    """Every run that flagged the pair (in either order), oldest first, with its stats and hedge ratio"""
+    with closing(connect(db_file)) as conn:
+        rows = conn.execute(
+            "SELECT * FROM pair_results WHERE sym_1 = ? AND sym_2 = ? "
+            "UNION ALL SELECT * FROM pair_results WHERE sym_1 = ? AND sym_2 = ? "
+            "ORDER BY run_time, run_id",
+            (sym_1, sym_2, sym_2, sym_1),
+        )
+        return [dict(row) for row in rows]
+
+
+def pair_persistence(sym_1, sym_2, db_file=HISTORY_DB):
+    """How long a pair has been cointegrated: first/last seen, hit rate and current streak"""
+    history = pair_history(sym_1, sym_2, db_file)
+    if not history:
+        return {"sym_1": sym_1, "sym_2": sym_2, "runs_flagged": 0, "first_seen": None, "last_seen": None,
+                "runs_since_first_seen": 0, "current_streak": 0}
+
+    flagged_runs = {row["run_id"] for row in history}
+    first_seen = history[0]["run_time"]
+    with closing(connect(db_file)) as conn:
+        run_ids = [row["run_id"] for row in conn.execute(
+            "SELECT run_id FROM runs WHERE run_time >= ? ORDER BY run_time DESC, run_id DESC", (first_seen,))]
+
+    current_streak = 0
+    for run_id in run_ids:
+        if run_id not in flagged_runs:
+            break
+        current_streak += 1
+
+    return {
+        "sym_1": sym_1,
+        "sym_2": sym_2,
+        "runs_flagged": len(flagged_runs),
+        "first_seen": first_seen,
+        "last_seen": history[-1]["run_time"],
+        "runs_since_first_seen": len(run_ids),
+        "current_streak": current_streak,
+    }
+
+
+def hedge_ratio_history(sym_1, sym_2, db_file=HISTORY_DB):
+    """(run_time, sym_1, sym_2, hedge_ratio) per run that flagged the pair, oldest first
+
+    The regression direction is returned as stored, since the symbols may swap order between runs.
+    """
+    return [(row["run_time"], row["sym_1"], row["sym_2"], row["hedge_ratio"])
+            for row in pair_history(sym_1, sym_2, db_file)]
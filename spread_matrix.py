@@ -0,0 +1,129 @@
+import json
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from price_cleaning import BAR_SECONDS, clean_close_panel
+
+# Post-scan outputs: (n_bars, n_pairs) float64 matrices in column-major order, so each pair's
+# column is contiguous on disk, plus a JSON index of their columns
+SPREAD_FILE = "3_spread_matrix.npy"
+ZSCORE_FILE = "3_zscore_matrix.npy"
+INDEX_FILE = "3_spread_matrix_index.json"
+RESULTS_FILE = "2_cointegrated_pairs.csv"
+
+# Pairs per z-score chunk; bounds the rolling-window temporaries to n_bars * CHUNK * window floats
+CHUNK_PAIRS = 64
+
+
+def rolling_zscores(spreads, window):
+    """calculate_zscore() for every column at once
+
+    Same rolling mean/std (min_periods=1, ddof=1) and 0 where undefined, but bars outside a
+    pair's window (NaN spread) stay NaN.
+    """
+    padded = np.vstack([np.full((window - 1, spreads.shape[1]), np.nan), spreads])
+    windows = sliding_window_view(padded, window, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean = np.nanmean(windows, axis=-1)
+        std = np.nanstd(windows, axis=-1, ddof=1)
+        zscores = (spreads - mean) / std
+    return np.where(np.isnan(spreads), np.nan, np.nan_to_num(zscores, nan=0.0, posinf=0.0, neginf=0.0))
+
+
+def build_spread_matrices(results_file=RESULTS_FILE, spread_file=SPREAD_FILE, zscore_file=ZSCORE_FILE,
+                          index_file=INDEX_FILE):
+    """Write spread and z-score matrices for every pair in the results CSV
+
+    Spreads use each pair's static hedge ratio over the bars the scan tested it on
+    (pair_window); other bars are NaN. Both matrices are written into .npy memmaps chunk by
+    chunk, so memory stays bounded whatever the pair count. Everything is built under temporary
+    names and moved into place matrices first, index last, so readers never map a partial file.
+    """
+    # The scan stack is only needed to build; readers of the matrices just need numpy
+    from calculate_cointegration import z_score_window, load_price_arrays, pair_window
+
+    df_coint = pd.read_csv(results_file)
+    symbols, start_ats, closes, _ = load_price_arrays()
+    if symbols is None:
+        return False
+
+    panel, segments, stats = clean_close_panel(start_ats, closes)
+    column_of = {symbol: k for k, symbol in enumerate(symbols)}
+    df_coint = df_coint[df_coint["sym_1"].isin(column_of) & df_coint["sym_2"].isin(column_of)]
+    i_cols = df_coint["sym_1"].map(column_of).to_numpy(dtype=np.int64)
+    j_cols = df_coint["sym_2"].map(column_of).to_numpy(dtype=np.int64)
+    hedge_ratios = df_coint["hedge_ratio"].to_numpy(dtype=np.float64)
+
+    n_bars, n_pairs = panel.shape[0], len(df_coint)
+    spread_tmp, zscore_tmp, index_tmp = f"{spread_file}.partial", f"{zscore_file}.partial", f"{index_file}.partial"
+    spreads = np.lib.format.open_memmap(spread_tmp, mode="w+", dtype=np.float64, shape=(n_bars, n_pairs),
+                                        fortran_order=True)
+    zscores = np.lib.format.open_memmap(zscore_tmp, mode="w+", dtype=np.float64, shape=(n_bars, n_pairs),
+                                        fortran_order=True)
+
+    rows = np.arange(n_bars)[:, None]
+    for chunk_start in range(0, n_pairs, CHUNK_PAIRS):
+        chunk = slice(chunk_start, min(chunk_start + CHUNK_PAIRS, n_pairs))
+        i, j = i_cols[chunk], j_cols[chunk]
+        windows = np.array([pair_window(None, segments, a, b) for a, b in zip(i, j)]).reshape(-1, 2)
+        inside = (rows >= windows[:, 0]) & (rows < windows[:, 1])
+
+        chunk_spreads = np.where(inside, panel[:, i] - panel[:, j] * hedge_ratios[chunk], np.nan)
+        spreads[:, chunk] = chunk_spreads
+        zscores[:, chunk] = rolling_zscores(chunk_spreads, z_score_window)
+
+    spreads.flush()
+    zscores.flush()
+    del spreads, zscores
+
+    index = {
+        "bars": n_bars,
+        "grid_start": stats["grid_start"],
+        "bar_seconds": BAR_SECONDS,
+        "z_score_window": z_score_window,
+        "pairs": [
+            {"column": k, "sym_1": sym_1, "sym_2": sym_2, "hedge_ratio": hedge_ratio}
+            for k, (sym_1, sym_2, hedge_ratio) in enumerate(zip(df_coint["sym_1"], df_coint["sym_2"], hedge_ratios))
+        ],
+    }
+    with open(index_tmp, "w") as f:
+        json.dump(index, f, indent=2)
+
+    os.replace(spread_tmp, spread_file)
+    os.replace(zscore_tmp, zscore_file)
+    os.replace(index_tmp, index_file)
+
+    print(f"✅ Spread and z-score matrices for {n_pairs} pairs x {n_bars} bars saved to {spread_file}, {zscore_file}")
+    return True
+
+
+def open_spread_matrices(spread_file=SPREAD_FILE, zscore_file=ZSCORE_FILE, index_file=INDEX_FILE):
+    """Memory-map the matrices read-only; returns (spreads, zscores, index) without loading any data
+
+    A rebuild replaces the matrices just before the index, so matrices that don't match the index
+    read first mean one is landing: the index is read again.
+    """
+    for _ in range(2):
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        spreads, zscores = np.load(spread_file, mmap_mode="r"), np.load(zscore_file, mmap_mode="r")
+        expected = (index["bars"], len(index["pairs"]))
+        if spreads.shape == expected and zscores.shape == expected:
+            break
+    return spreads, zscores, index
+
+
+def pair_column(index, sym_1, sym_2):
+    """Column of a pair in the matrices (either symbol order), or None"""
+    for pair in index["pairs"]:
+        if {pair["sym_1"], pair["sym_2"]} == {sym_1, sym_2}:
+            return pair["column"]
+    return None
+
+
+if __name__ == "__main__":
+    build_spread_matrices()
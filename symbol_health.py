@@ -0,0 +1,86 @@
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEALTH_FILE = "symbol_health.json"
+
+# A bad symbol is skipped for HEALTH_TTL, doubling with every consecutive failure up to HEALTH_MAX_TTL
+HEALTH_TTL = 24 * 3600
+HEALTH_MAX_TTL = 7 * 24 * 3600
+
+# Fewer candles than this marks a symbol as short history (fetched, but after everything else)
+SHORT_HISTORY_CANDLES = 500
+
+RESOLVE_FAILED = "resolve_failed"
+EMPTY = "empty"
+SHORT_HISTORY = "short_history"
+
+
+def load_symbol_health(filename=HEALTH_FILE):
+    """Load the persistent symbol-health cache ({symbol: record})"""
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Ignoring unreadable symbol health cache {filename}: {e}")
+        return {}
+
+
+def save_symbol_health(health, filename=HEALTH_FILE):
+    tmp_file = f"{filename}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(health, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, filename)
+
+
+def record_ttl(record):
+    return min(HEALTH_MAX_TTL, HEALTH_TTL * 2 ** (record["failures"] - 1))
+
+
+def is_quarantined(record, now):
+    """True while a dead symbol's TTL has not expired; afterwards it gets one re-probe"""
+    if record["status"] == SHORT_HISTORY:
+        return False
+    return now - record["last_checked"] < record_ttl(record)
+
+
+def plan_fetch(symbols, health, now=None):
+    """Split symbols into (to_fetch, skipped); healthy first, re-probes and short histories last"""
+    now = time.time() if now is None else now
+    healthy, deprioritized, skipped = [], [], []
+
+    for symbol in symbols:
+        record = health.get(symbol)
+        if record is None:
+            healthy.append(symbol)
+        elif is_quarantined(record, now):
+            skipped.append(symbol)
+        else:
+            deprioritized.append(symbol)
+
+    return healthy + deprioritized, skipped
+
+
+def update_symbol_health(health, symbol, status, n_candles=0, now=None):
+    """Record the outcome of a fetch; status is one of RESOLVE_FAILED, EMPTY or None for data"""
+    now = time.time() if now is None else now
+
+    if status is None and n_candles >= SHORT_HISTORY_CANDLES:
+        health.pop(symbol, None)
+        return
+
+    if status is None:
+        status = SHORT_HISTORY
+    previous = health.get(symbol)
+    failures = previous["failures"] + 1 if previous and previous["status"] == status else 1
+    health[symbol] = {
+        "status": status,
+        "failures": failures,
+        "last_checked": int(now),
+        "candles": n_candles,
+    }
@@ -0,0 +1,63 @@
+import numpy as np
+
+from price_cleaning import align_close_panel
+
+# Rolling dollar volume: sums over DOLLAR_VOLUME_WINDOW bars (one day of hourly bars), and a
+# symbol's liquidity is the median of those sums over the last DOLLAR_VOLUME_LOOKBACK bars
+DOLLAR_VOLUME_WINDOW = 24
+DOLLAR_VOLUME_LOOKBACK = 30 * 24
+
+# Default thresholds; 0 / None disable a check
+MIN_DAILY_DOLLAR_VOLUME = 1_000_000
+MIN_PRICE = 0.0
+MAX_PRICE = None
+
+
+def rolling_dollar_volume(close_panel, volume_panel, window=DOLLAR_VOLUME_WINDOW):
+    """(n_bars - window + 1, n_symbols) rolling sums of close * volume; missing bars count as 0"""
+    dollar_volume = np.nan_to_num(close_panel * volume_panel, nan=0.0)
+    cumulative = np.vstack([np.zeros((1, dollar_volume.shape[1])), np.cumsum(dollar_volume, axis=0)])
+    return cumulative[window:] - cumulative[:-window]
+
+
+def median_daily_dollar_volume(close_panel, volume_panel, window=DOLLAR_VOLUME_WINDOW,
+                               lookback=DOLLAR_VOLUME_LOOKBACK):
+    rolling = rolling_dollar_volume(close_panel, volume_panel, window)
+    if len(rolling) == 0:
+        return np.zeros(close_panel.shape[1])
+    return np.median(rolling[-lookback:], axis=0)
+
+
+def last_valid_prices(close_panel, segments):
+    """Close at the end of each symbol's valid segment (NaN if it has none)"""
+    has_segment = segments[:, 1] > segments[:, 0]
+    rows = np.where(has_segment, segments[:, 1] - 1, 0)
+    return np.where(has_segment, close_panel[rows, np.arange(close_panel.shape[1])], np.nan)
+
+
+def select_universe(start_ats, close_panel, segments, volumes, min_dollar_volume=MIN_DAILY_DOLLAR_VOLUME,
+                    min_price=MIN_PRICE, max_price=MAX_PRICE):
+    """Boolean mask of symbols liquid enough and priced within range to be worth pairing
+
+    close_panel is the cleaned (n_bars, n_symbols) panel; volumes are aligned onto the same
+    grid here. Symbols without any volume data are kept, since there is nothing to judge them on.
+    Returns (keep, stats).
+    """
+    volume_panel, _ = align_close_panel(start_ats, volumes)
+    has_volume = np.isfinite(volume_panel).any(axis=0)
+    daily_dollar_volume = median_daily_dollar_volume(close_panel, volume_panel)
+    prices = last_valid_prices(close_panel, segments)
+
+    liquid = ~has_volume | (daily_dollar_volume >= (min_dollar_volume or 0))
+    priced = np.isfinite(prices) & (prices >= (min_price or 0))
+    if max_price is not None:
+        priced &= prices <= max_price
+
+    keep = liquid & priced
+    stats = {
+        "kept": int(keep.sum()),
+        "illiquid": int((~liquid).sum()),
+        "out_of_price_range": int((liquid & ~priced).sum()),
+        "no_volume": int((~has_volume).sum()),
+    }
+    return keep, stats
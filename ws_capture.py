@@ -0,0 +1,240 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+import numpy as np
+import websocket
+
+from profiling import enable, profiled
+
+logger = logging.getLogger(__name__)
+
+# FETCH_CAPTURE_DIR records every TradingView session the fetcher opens; FETCH_REPLAY_DIR
+# serves the fetcher from those recordings instead of the network, at FETCH_REPLAY_SPEED
+# ("max", or a multiple of the original pace: 1 = as recorded)
+CAPTURE_ENV = "FETCH_CAPTURE_DIR"
+REPLAY_ENV = "FETCH_REPLAY_DIR"
+REPLAY_SPEED_ENV = "FETCH_REPLAY_SPEED"
+CAPTURE_DIR = "captures"
+CAPTURE_SUFFIX = ".jsonl.gz"
+
+
+def capture_path(capture_dir, symbol):
+    return os.path.join(capture_dir, f"{symbol}{CAPTURE_SUFFIX}")
+
+
+class RecordingConnection:
+    """WebSocket wrapper that logs every received frame with its time since connect
+
+    Each session is appended to the symbol's log as one gzip member when the connection is
+    closed: a header line, then one [seconds, frame] JSON line per frame. Earlier sessions are
+    never rewritten, and a session cut short by a crash costs only that session.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, ws, path, symbol, url):
+        self.ws = ws
+        self.path = path
+        self.header = {"symbol": symbol, "url": url, "started_at": datetime.now().isoformat(timespec="seconds")}
+        self.frames = []
+        self._started = time.perf_counter()
+
+    def send(self, payload):
+        return self.ws.send(payload)
+
+    def recv(self):
+        frame = self.ws.recv()
+        self.frames.append((round(time.perf_counter() - self._started, 6), frame))
+        return frame
+
+    def close(self):
+        try:
+            self.ws.close()
+        finally:
+            self.flush()
+
+    def flush(self):
+        if self.frames is None:
+            return
+        lines = [json.dumps(self.header)] + [json.dumps(frame, separators=(",", ":")) for frame in self.frames]
+        self.frames = None
+        try:
+            with self._lock, open(self.path, "ab") as f:
+                f.write(gzip.compress(("\n".join(lines) + "\n").encode()))
+        except OSError as e:
+            logger.error(f"❌ Could not write capture {self.path}: {e}")
+
+
+def read_sessions(path):
+    """[(header, [(seconds, frame), ...]), ...] for every session in a capture log, oldest first
+
+    Sessions are read one gzip member at a time; a torn last member from an interrupted write
+    is dropped and everything before it kept.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+
+    sessions = []
+    while data:
+        member = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            text = member.decompress(data)
+        except zlib.error:
+            break
+        if not member.eof:
+            break
+        data = member.unused_data
+        lines = text.decode().splitlines()
+        frames = [tuple(json.loads(line)) for line in lines[1:]]
+        sessions.append((json.loads(lines[0]), frames))
+    return sessions
+
+
+def captured_symbols(capture_dir=CAPTURE_DIR):
+    if not os.path.isdir(capture_dir):
+        return []
+    return sorted(name[:-len(CAPTURE_SUFFIX)] for name in os.listdir(capture_dir) if name.endswith(CAPTURE_SUFFIX))
+
+
+class ReplayConnection:
+    """Stand-in for a WebSocket that plays one recorded session back
+
+    speed=None returns frames as fast as they are asked for; otherwise frames are held back
+    until their recorded time divided by speed. Sent messages are ignored.
+    """
+
+    def __init__(self, frames, speed=None):
+        self.frames = frames
+        self.speed = speed
+        self._next = 0
+        self._started = time.perf_counter()
+
+    def send(self, payload):
+        pass
+
+    def recv(self):
+        if self._next >= len(self.frames):
+            raise websocket.WebSocketConnectionClosedException("end of recorded session")
+        seconds, frame = self.frames[self._next]
+        self._next += 1
+        if self.speed:
+            wait = self._started + seconds / self.speed - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        return frame
+
+    def close(self):
+        pass
+
+
+def capture_transport(url, capture_dir=CAPTURE_DIR):
+    """Connection factory for fetch_candles that records each session under capture_dir"""
+    os.makedirs(capture_dir, exist_ok=True)
+
+    def connect(symbol):
+        return RecordingConnection(websocket.create_connection(url), capture_path(capture_dir, symbol), symbol, url)
+    return connect
+
+
+def replay_transport(capture_dir=CAPTURE_DIR, speed=None):
+    """Connection factory for fetch_candles that replays each symbol's latest recorded session
+
+    Sessions are read once per symbol and kept, so repeated replays measure the fetcher, not gzip.
+    """
+    cache = {}
+
+    def connect(symbol):
+        if symbol not in cache:
+            sessions = read_sessions(capture_path(capture_dir, symbol))
+            cache[symbol] = sessions[-1][1] if sessions else None
+        if cache[symbol] is None:
+            raise websocket.WebSocketConnectionClosedException(f"no recorded session for {symbol}")
+        return ReplayConnection(cache[symbol], speed)
+    return connect
+
+
+def parse_speed(text):
+    """None for "max", else the replay speed factor"""
+    return None if text in ("", "max", "0") else float(text)
+
+
+def transport_from_env(url):
+    """The connection factory selected by FETCH_REPLAY_DIR / FETCH_CAPTURE_DIR, or None for the live socket"""
+    replay_dir = os.environ.get(REPLAY_ENV)
+    if replay_dir:
+        return replay_transport(replay_dir, parse_speed(os.environ.get(REPLAY_SPEED_ENV, "max").lower()))
+    capture_dir = os.environ.get(CAPTURE_ENV)
+    if capture_dir:
+        return capture_transport(url, capture_dir)
+    return None
+
+
+@profiled("replay_fetch")
+def replay_fetch(capture_dir=CAPTURE_DIR, speed=None, workers=1, check_file=None):
+    """Run the fetcher over every captured symbol with no network and report its throughput
+
+    With check_file (a NumPy price store), each replayed symbol's candles are compared with the
+    stored ones; returns the list of symbols that differ.
+    """
+    import fetch_candles
+    from price_store import candles_to_array
+
+    symbols = captured_symbols(capture_dir)
+    if not symbols:
+        logger.error(f"❌ No captures found in {capture_dir}")
+        return None
+
+    fetch_candles.set_transport(replay_transport(capture_dir, speed))
+    dataset = fetch_candles.CandleDataset()
+    try:
+        started = time.perf_counter()
+        statuses = fetch_candles.fetch_symbols(symbols, dataset, None, workers=workers)
+        seconds = time.perf_counter() - started
+
+        candles = sum(dataset.counts.values())
+        ok = sum(1 for status in statuses.values() if status == fetch_candles.FETCH_OK)
+        logger.info(f"⏱️ Replayed {ok}/{len(symbols)} symbols, {candles} candles in {seconds:.2f}s "
+                    f"({candles / max(seconds, 1e-9):,.0f} candles/s, speed {speed or 'max'})")
+
+        mismatched = []
+        if check_file:
+            with np.load(check_file) as stored:
+                for symbol, candle_data in dataset.items():
+                    if symbol not in stored.files or not np.array_equal(candles_to_array(candle_data), stored[symbol]):
+                        mismatched.append(symbol)
+            missing = [symbol for symbol in symbols if statuses.get(symbol) != fetch_candles.FETCH_OK]
+            mismatched += missing
+            if mismatched:
+                logger.warning(f"⚠️ {len(mismatched)} symbols differ from {check_file}: {', '.join(mismatched)}")
+            else:
+                logger.info(f"✅ All replayed symbols match {check_file}")
+        return mismatched
+    finally:
+        dataset.release()
+        fetch_candles.set_transport(None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured TradingView sessions through the fetcher")
+    parser.add_argument("capture_dir", nargs="?", default=CAPTURE_DIR)
+    parser.add_argument("--speed", default="max", help='"max" or a multiple of the recorded pace (1 = original)')
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--check", metavar="NPZ", help="compare the replayed candles with this price store")
+    parser.add_argument("--profile", nargs="?", const="all", choices=["all", "cpu", "mem"],
+                        help="profile the replay (see profiling.py)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.profile:
+        enable(args.profile)
+    mismatched = replay_fetch(args.capture_dir, parse_speed(args.speed.lower()), args.workers, args.check)
+    raise SystemExit(0 if mismatched == [] else 1)